@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+Benchmark.py is a script that generates deterministic synthetic inputs
+(directory trees, fiwalk style DFXML reports, RegXML hives and raw disk
+images containing hive files) and then times each tool in this project,
+recording the elapsed time and peak memory use of every run. Results are
+written as JSON so that runs can be compared to find regressions.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+
+"""
+
+__version__ = "0.1.0"
+
+import sys
+import os
+import json
+import math
+import time
+import random
+import shutil
+import hashlib
+import datetime
+import platform
+import tempfile
+import subprocess
+import xml.sax.saxutils
+
+# Root directory of the DFXMLTools project
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+XMLNS_DFXML = "http://www.forensicswiki.org/wiki/Category:Digital_Forensics_XML"
+
+# Preset input sizes for each benchmark scale
+SCALES = {"small" : {"files" : 1000,
+                     "fileobjects" : 10000,
+                     "regxml_depth" : 5,
+                     "image_mb" : 16},
+          "medium" : {"files" : 10000,
+                      "fileobjects" : 1000000,
+                      "regxml_depth" : 7,
+                      "image_mb" : 128},
+          "large" : {"files" : 100000,
+                     "fileobjects" : 10000000,
+                     "regxml_depth" : 9,
+                     "image_mb" : 1024}}
+
+# Paths of hive files placed in synthetic DFXML reports and disk images
+HIVE_PATHS = ["Windows/System32/config/SAM",
+              "Windows/System32/config/SECURITY",
+              "Windows/System32/config/SOFTWARE",
+              "Windows/System32/config/SYSTEM",
+              "Windows/System32/config/COMPONENTS",
+              "Windows/repair/SAM",
+              "Windows/repair/SYSTEM",
+              "Users/alice/NTUSER.DAT",
+              "Users/alice/AppData/Local/Microsoft/Windows/UsrClass.dat",
+              "Documents and Settings/bob/NTUSER.DAT",
+              "Documents and Settings/bob/Local Settings/Application Data/Microsoft/Windows/UsrClass.dat"]
+
+# Directory and file name parts for synthetic file names
+DIR_NAMES = ["Windows", "System32", "Program Files", "Users", "alice", "bob",
+             "AppData", "Local", "Temp", "drivers", "Microsoft", "Documents",
+             "Downloads", "cache", "logs", "config", "inf", "WinSxS"]
+FILE_EXTS = [".dll", ".exe", ".sys", ".txt", ".log", ".ini", ".dat", ".xml",
+             ".jpg", ".doc", ".pf", ".evtx", ".lnk", ".tmp"]
+
+BLOCK_SIZE = 4096
+
+################################################################################
+def generate_tree(path, file_count, min_size=0, max_size=1024 * 1024, seed=1):
+    """ Generate a directory tree of file_count files. File sizes are log
+        uniformly distributed between min_size and max_size. """
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    dirs = [path]
+    for i in range(file_count):
+        # Roughly one new directory for every 20 files
+        if rng.random() < 0.05:
+            parent = rng.choice(dirs)
+            new_dir = os.path.join(parent, "%s-%d" % (rng.choice(DIR_NAMES), len(dirs)))
+            os.makedirs(new_dir, exist_ok=True)
+            dirs.append(new_dir)
+        size = _log_uniform(rng, min_size, max_size)
+        fn = os.path.join(rng.choice(dirs), "file-%d%s" % (i, rng.choice(FILE_EXTS)))
+        with open(fn, 'wb') as f:
+            f.write(rng.randbytes(size))
+
+def generate_dfxml(path, fileobject_count, seed=1):
+    """ Generate a fiwalk style DFXML report with fileobject_count
+        fileobjects. The content of the files is not generated, so hashes
+        are derived from the file name. """
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(_dfxml_header("image.raw"))
+        f.write("<volume offset='0'>\n")
+        f.write("<partition_offset>0</partition_offset>\n<block_size>%d</block_size>\n" % BLOCK_SIZE)
+        block = 0
+        for i in range(fileobject_count):
+            if i < len(HIVE_PATHS):
+                fn = HIVE_PATHS[i]
+            else:
+                depth = rng.randint(1, 6)
+                parts = [rng.choice(DIR_NAMES) for j in range(depth)]
+                parts.append("file-%d%s" % (i, rng.choice(FILE_EXTS)))
+                fn = "/".join(parts)
+            size = _log_uniform(rng, 0, 16 * 1024 * 1024)
+            runs = list()
+            # Split larger files into up to three fragments
+            fragments = 1 if size < 65536 else rng.randint(1, 3)
+            remaining = size
+            file_offset = 0
+            for j in range(fragments):
+                length = remaining if j == fragments - 1 else remaining // fragments
+                block += rng.randint(0, 64)
+                runs.append((file_offset, block * BLOCK_SIZE, length))
+                block += (length // BLOCK_SIZE) + 1
+                file_offset += length
+                remaining -= length
+            digest = hashlib.sha1(fn.encode('utf-8') + str(i).encode('ascii'))
+            f.write(_fileobject_xml(fn, size, rng.random() < 0.8, i + 16, runs,
+                                    digest.hexdigest()[:32], digest.hexdigest(), rng))
+        f.write("</volume>\n</dfxml>\n")
+
+def generate_regxml(path, depth, fanout=4, values=3, seed=1):
+    """ Generate a hivexml style RegXML hive with keys nested depth levels
+        deep, each key having fanout subkeys and a number of values. """
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<hive>\n")
+        f.write("<node name='$$$PROTO.HIV' root='1'>\n")
+        _write_regxml_node(f, rng, 1, depth, fanout, values)
+        f.write("</node>\n</hive>\n")
+
+def generate_image(image_path, dfxml_path, size_mb, seed=1):
+    """ Generate a raw disk image containing hive files at known byte runs,
+        and a matching fiwalk style DFXML report. Larger hives are split
+        into two fragments. """
+    rng = random.Random(seed)
+    total_blocks = (size_mb * 1024 * 1024) // BLOCK_SIZE
+    with open(image_path, 'wb') as img:
+        for i in range(0, total_blocks, 256):
+            img.write(rng.randbytes(BLOCK_SIZE * min(256, total_blocks - i)))
+    with open(image_path, 'r+b') as img, open(dfxml_path, 'w', encoding='utf-8') as f:
+        f.write(_dfxml_header(os.path.basename(image_path)))
+        f.write("<volume offset='0'>\n")
+        block = 64
+        for (i, fn) in enumerate(HIVE_PATHS):
+            size = rng.randint(8, 256) * BLOCK_SIZE + rng.randint(0, BLOCK_SIZE - 1)
+            content = b"regf" + rng.randbytes(size - 4)
+            fragments = 2 if size > 64 * BLOCK_SIZE else 1
+            runs = list()
+            file_offset = 0
+            for j in range(fragments):
+                length = size - file_offset if j == fragments - 1 else size // 2
+                if (block + (length // BLOCK_SIZE) + 1) * BLOCK_SIZE > size_mb * 1024 * 1024:
+                    raise ValueError("Disk image is too small for the synthetic hive files")
+                img.seek(block * BLOCK_SIZE)
+                img.write(content[file_offset:file_offset + length])
+                runs.append((file_offset, block * BLOCK_SIZE, length))
+                block += (length // BLOCK_SIZE) + 1 + rng.randint(1, 32)
+                file_offset += length
+            f.write(_fileobject_xml(fn, size, True, i + 16, runs,
+                                    hashlib.md5(content).hexdigest(),
+                                    hashlib.sha1(content).hexdigest(), rng))
+        f.write("</volume>\n</dfxml>\n")
+
+def _log_uniform(rng, low, high):
+    """ Helper method to pick a log uniformly distributed integer. """
+    return int(math.exp(rng.uniform(math.log(low + 1), math.log(high + 1)))) - 1
+
+def _dfxml_header(image_filename):
+    """ Helper method to create the header of a fiwalk style DFXML report. """
+    return ("<?xml version='1.0' encoding='UTF-8'?>\n"
+            "<dfxml xmlns='%s' xmlns:dc='http://purl.org/dc/elements/1.1/' version='1.0'>\n"
+            "<metadata><dc:type>Disk Image</dc:type></metadata>\n"
+            "<creator version='1.0'><program>Benchmark.py</program>"
+            "<version>%s</version></creator>\n"
+            "<source><image_filename>%s</image_filename></source>\n" %
+            (XMLNS_DFXML, __version__, xml.sax.saxutils.escape(image_filename)))
+
+def _fileobject_xml(fn, size, allocated, inode, runs, md5, sha1, rng):
+    """ Helper method to create a fiwalk style fileobject element. """
+    mtime = 1262304000 + rng.randint(0, 10 ** 8)
+    times = "".join("<%s>%s</%s>" % (name, _isotime(mtime - offset), name)
+                    for (name, offset) in (("mtime", 0), ("ctime", 60), ("atime", -60), ("crtime", 3600)))
+    byte_runs = "".join("<byte_run file_offset='%d' fs_offset='%d' img_offset='%d' len='%d'/>" %
+                        (file_offset, img_offset, img_offset, length)
+                        for (file_offset, img_offset, length) in runs)
+    return ("<fileobject>\n"
+            "<filename>%s</filename><partition>1</partition><id>%d</id>"
+            "<name_type>r</name_type><filesize>%d</filesize>"
+            "<alloc>%d</alloc><used>1</used><inode>%d</inode><meta_type>1</meta_type>"
+            "<mode>511</mode><nlink>1</nlink><uid>0</uid><gid>0</gid>%s\n"
+            "<byte_runs>%s</byte_runs>\n"
+            "<hashdigest type='md5'>%s</hashdigest>\n"
+            "<hashdigest type='sha1'>%s</hashdigest>\n"
+            "</fileobject>\n" %
+            (xml.sax.saxutils.escape(fn), inode, size, 1 if allocated else 0, inode,
+             times, byte_runs, md5, sha1))
+
+def _isotime(timestamp):
+    """ Helper method to format a POSIX timestamp as a DFXML time. """
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _write_regxml_node(f, rng, level, depth, fanout, values):
+    """ Helper method to recursively write RegXML keys and values. """
+    for i in range(values):
+        f.write("<value type='string' key='Value%d' value='%s'/>\n" % (i, rng.randbytes(8).hex()))
+    if level >= depth:
+        return
+    for i in range(fanout):
+        f.write("<node name='Key%d-%d'>\n" % (level, i))
+        f.write("<mtime>%s</mtime>\n" % _isotime(1262304000 + rng.randint(0, 10 ** 8)))
+        _write_regxml_node(f, rng, level + 1, depth, fanout, values)
+        f.write("</node>\n")
+
+################################################################################
+class Benchmark:
+    def __init__(self, workdir=None, scale="small", jobs=4, python=sys.executable):
+        if workdir is None:
+            workdir = tempfile.mkdtemp(prefix="dfxmltools-benchmark-")
+        # Tools run in their own directory, so input paths must be absolute
+        self.workdir = os.path.abspath(workdir)
+        self.scale = scale
+        self.params = SCALES[scale]
+        self.jobs = jobs
+        self.python = python
+        self.results = list()
+
+    def path(self, *parts):
+        """ Helper method to build a path in the working directory. """
+        return os.path.join(self.workdir, *parts)
+
+    def generate(self):
+        """ Generate the synthetic inputs, unless they already exist for the
+            same scale in the working directory. """
+        stamp = self.path("inputs-%s.json" % self.scale)
+        if os.path.exists(stamp):
+            print(">>> Reusing synthetic inputs in: %s" % self.workdir)
+            return
+        print(">>> Generating %s synthetic inputs in: %s" % (self.scale, self.workdir))
+        generate_tree(self.path("tree"), self.params["files"])
+        generate_dfxml(self.path("fiwalk.xml"), self.params["fileobjects"])
+        generate_regxml(self.path("hive.regxml"), self.params["regxml_depth"])
+        generate_image(self.path("image.raw"), self.path("image.xml"), self.params["image_mb"])
+        with open(stamp, 'w') as f:
+            json.dump(self.params, f)
+
+    def cases(self):
+        """ Return a list of (tool, case name, arguments, stdin) tuples. """
+        out = self.path("output")
+        return [("Dir2DFXML", "serial",
+                 ["-r", "-o", os.path.join(out, "tree.xml"), self.path("tree")], None),
+                ("Dir2DFXML", "jobs-%d" % self.jobs,
+                 ["-r", "-j", str(self.jobs), "-o", os.path.join(out, "tree.xml"), self.path("tree")], None),
+                ("DFXML2sha1deep", "fiwalk",
+                 [self.path("fiwalk.xml")], None),
+                ("SearchDFXML", "keyword",
+                 [self.path("fiwalk.xml"), os.path.join(out, "search.xml")], "dll\n"),
+                ("HiveExtractor", "image",
+                 ["-z", "--dfxml", self.path("image.xml"), self.path("image.raw"),
+                  os.path.join(out, "hives")], None),
+                ("FlattenRegXML", "hive",
+                 [self.path("hive.regxml")], None)]
+
+    def run(self, tools=None):
+        """ Run each benchmark case, recording the elapsed time and peak
+            memory use (maximum resident set size) of the tool. Returns the
+            number of failed cases. """
+        os.makedirs(self.path("output"), exist_ok=True)
+        failures = 0
+        for (tool, name, args, stdin) in self.cases():
+            if tools and tool not in tools:
+                continue
+            print(">>> Running %s (%s) ..." % (tool, name))
+            result = self.run_case(tool, args, stdin)
+            result["case"] = name
+            self.results.append(result)
+            status = "ok" if result["returncode"] == 0 else "FAILED (%d)" % result["returncode"]
+            print("    %.3f seconds, %d KB peak RSS, %s" %
+                  (result["seconds"], result["max_rss_kb"], status))
+            if result["returncode"] != 0:
+                failures += 1
+                print("    See: %s" % self.path("output", tool + ".log"))
+        return failures
+
+    def run_case(self, tool, args, stdin):
+        """ Run a single tool in its own directory and measure it. """
+        tool_dir = os.path.join(PROJECT_DIR, tool)
+        command = [self.python, tool + ".py"] + args
+        with open(self.path("output", tool + ".log"), 'wb') as log:
+            start = time.perf_counter()
+            proc = subprocess.Popen(command, cwd=tool_dir,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=log)
+            if stdin:
+                proc.stdin.write(stdin.encode('utf-8'))
+            proc.stdin.close()
+            # os.wait4 reports resource usage of this child process only
+            (pid, status, usage) = os.wait4(proc.pid, 0)
+            seconds = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        max_rss_kb = usage.ru_maxrss
+        if sys.platform == "darwin":
+            max_rss_kb //= 1024
+        return {"tool" : tool,
+                "command" : " ".join(command[1:]),
+                "seconds" : seconds,
+                "max_rss_kb" : max_rss_kb,
+                "returncode" : proc.returncode}
+
+    def report(self, output):
+        """ Write the benchmark results to a JSON file. """
+        data = {"version" : __version__,
+                "date" : datetime.datetime.now().isoformat(),
+                "scale" : self.scale,
+                "params" : self.params,
+                "python" : platform.python_version(),
+                "os_sysname" : platform.system(),
+                "os_release" : platform.release(),
+                "os_host" : platform.node(),
+                "os_arch" : platform.machine(),
+                "cpu_count" : os.cpu_count(),
+                "results" : self.results}
+        with open(output, 'w') as f:
+            json.dump(data, f, indent=2)
+        print("\n>>> Benchmark results: %s\n" % output)
+
+def compare(baseline_fn, current_fn, threshold=0.10):
+    """ Compare two benchmark result files, and print the relative change of
+        each case. Returns the number of cases that regressed by more than
+        threshold (as a fraction) in time or memory. """
+    with open(baseline_fn) as f:
+        baseline = json.load(f)
+    with open(current_fn) as f:
+        current = json.load(f)
+    if baseline.get("scale") != current.get("scale"):
+        print("Warning: Comparing different scales (%s and %s)" %
+              (baseline.get("scale"), current.get("scale")))
+    previous = dict(((r["tool"], r["case"]), r) for r in baseline["results"])
+    regressions = 0
+    print("%-16s %-10s %10s %10s" % ("Tool", "Case", "Time", "Memory"))
+    for result in current["results"]:
+        old = previous.get((result["tool"], result["case"]))
+        if old is None or old["returncode"] or result["returncode"]:
+            continue
+        time_change = _relative_change(old["seconds"], result["seconds"])
+        rss_change = _relative_change(old["max_rss_kb"], result["max_rss_kb"])
+        flag = ""
+        if time_change > threshold or rss_change > threshold:
+            flag = "  <-- regression"
+            regressions += 1
+        print("%-16s %-10s %+9.1f%% %+9.1f%%%s" %
+              (result["tool"], result["case"], time_change * 100, rss_change * 100, flag))
+    return regressions
+
+def _relative_change(old, new):
+    """ Helper method to calculate the relative change between values. """
+    if not old:
+        return 0.0
+    return (new - old) / old
+
+################################################################################
+if __name__=='__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="""
+Benchmark.py is a script that generates deterministic synthetic inputs
+(directory trees, fiwalk style DFXML reports, RegXML hives and raw disk
+images containing hive files) and then times each tool in this project,
+recording the elapsed time and peak memory use of every run. Results are
+written as JSON so that runs can be compared to find regressions.""")
+    parser.add_argument("output",
+                        help = "Output JSON results file (e.g. results.json)")
+    parser.add_argument("--scale",
+                        help = "Size of synthetic inputs (default: small)",
+                        choices = sorted(SCALES.keys()),
+                        default = "small")
+    parser.add_argument("--workdir",
+                        metavar = "DIR",
+                        help = "Directory for synthetic inputs, reused between runs (default: temporary directory)")
+    parser.add_argument("--tool",
+                        help = "Only benchmark this tool (can be repeated)",
+                        action = "append")
+    parser.add_argument("-j", "--jobs",
+                        metavar = "N",
+                        help = "Number of jobs for parallel benchmark cases (default: 4)",
+                        type = int,
+                        default = 4)
+    parser.add_argument("--compare",
+                        metavar = "BASELINE",
+                        help = "Compare results to a previous results file")
+    parser.add_argument("--threshold",
+                        help = "Regression threshold for --compare, as a percentage (default: 10)",
+                        type = float,
+                        default = 10.0)
+    args = parser.parse_args()
+
+    workdir = args.workdir
+    if workdir is not None:
+        os.makedirs(workdir, exist_ok=True)
+
+    benchmark = Benchmark(workdir = workdir,
+                          scale = args.scale,
+                          jobs = args.jobs)
+    failures = 0
+    try:
+        benchmark.generate()
+        failures = benchmark.run(args.tool)
+        # Results of a broken run are not saved, so they cannot become a baseline
+        if not failures:
+            benchmark.report(args.output)
+    finally:
+        # The logs of failed cases are kept in a temporary working directory
+        if args.workdir is None and not failures:
+            shutil.rmtree(benchmark.workdir)
+    if failures:
+        print("\nError: %d benchmark cases failed, results not written" % failures)
+        sys.exit(1)
+    if args.compare:
+        regressions = compare(args.compare, args.output, args.threshold / 100)
+        if regressions:
+            sys.exit(1)
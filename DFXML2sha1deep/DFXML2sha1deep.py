@@ -29,35 +29,203 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 >>> CHANGELOG:
     0.1.0       Base functionality
+    0.2.0       Lean streaming parser and buffered output
+    0.3.0       One pass export to multiple hash set formats
+    0.4.0       Parse large DFXML reports in parallel (--jobs)
+    0.5.0       Read and write compressed files (.gz, .bz2 or .xz)
+    0.6.0       Throughput statistics and profiling (--stats, --profile)
 
 """
 
-__version__ = "0.1.0"
+__version__ = "0.6.0"
 
 import sys
 import os
+import csv
 
-sys.path.append(r'../dfxml/python')
-try:
-    import Objects
-except ImportError:
-    print('Error: The DFXML Objects.py module is required to run this program')
-    print('You can download from: https://github.com/simsong/dfxml')
-    print('Now Exiting...')
-    sys.exit(1)
-
-################################################################################      
-def process_dfxml(xmlfile):
-    """ Process the target DFXML report and produce hashdeep report. """
-    for (event, obj) in Objects.iterparse(xmlfile):
-        if isinstance(obj, Objects.FileObject):
-            process_fi(obj)
-
-def process_fi(fi):
-    sha1 = fi.sha1
-    if not sha1:
+sys.path.append(r'../common')
+import fastparse
+import hashset
+import compressed
+import sharded
+import instrument
+
+# Size of the buffer used when writing each hash set
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+################################################################################
+def process_dfxml(xmlfile, writers, jobs=1, stats=None):
+    """ Process the target DFXML report and write each hash set. The DFXML
+        report is parsed once, and only the fields needed by the hash set
+        writers are extracted. If jobs is greater than one, shards of the
+        report are parsed in parallel (hash sets are still in order). """
+    if stats is None:
+        stats = instrument.Stats(os.path.basename(__file__))
+    fields = list()
+    for writer in writers:
+        fields.extend(field for field in writer.fields if field not in fields)
+    if jobs > 1 and not sharded.is_shardable(xmlfile):
+        print("Warning: Compressed DFXML reports cannot be parsed in parallel", file=sys.stderr)
+        jobs = 1
+    if jobs > 1:
+        records = iter_sharded_fields(xmlfile, fields, jobs)
+        stats.count(bytes_parsed=os.path.getsize(xmlfile))
+        source = None
+    else:
+        source = instrument.CountingReader(compressed.open_input(xmlfile), stats)
+        records = fastparse.iter_fields(source, fields)
+    try:
+        for record in stats.iterate(records, "parse"):
+            with stats.phase("serialize"):
+                for writer in writers:
+                    writer.write(record)
+            stats.count(files=1)
+    except BaseException:
+        # Hash sets of a partly parsed DFXML report are not kept
+        for writer in writers:
+            writer.abort()
+        raise
+    else:
+        for writer in writers:
+            writer.close()
+    finally:
+        if source is not None:
+            source.close()
+
+def iter_sharded_fields(xmlfile, fields, jobs):
+    """ Generator. Yields the fields of each fileobject, in document order,
+        from shards of the DFXML report parsed by a process pool. """
+    worker = sharded.FieldsWorker(fields)
+    for (count, records) in sharded.map_shards(xmlfile, worker, jobs):
+        for record in records:
+            yield record
+
+def open_output(output):
+    """ Helper method to open a buffered output file, or stdout if output
+        is None or "-". File names ending in .gz, .bz2 or .xz are compressed. """
+    if output is None or output == "-":
+        return open(sys.stdout.fileno(), 'w', encoding='utf-8',
+                    buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    return compressed.open_output(output, buffering=OUTPUT_BUFFER_SIZE)
+
+def remove_output(output):
+    """ Helper method to remove an incomplete output file. Nothing is
+        removed if output is stdout. """
+    if output is None or output == "-":
         return
-    print("%s  %s" % (sha1, fi.filename))
+    if os.path.exists(output):
+        os.remove(output)
+
+class HashListWriter:
+    def __init__(self, output, algorithm="sha1"):
+        """ Write a md5deep, sha1deep or sha256deep style hash set. """
+        self.algorithm = algorithm
+        self.fields = ("filename", algorithm)
+        self.output = output
+        self.out = open_output(output)
+
+    def write(self, record):
+        digest = record[self.algorithm]
+        if not digest:
+            return
+        self.out.write("%s  %s\n" % (digest, record["filename"]))
+
+    def close(self):
+        self.out.close()
+
+    def abort(self):
+        self.out.close()
+        remove_output(self.output)
+
+class HashDeepWriter:
+    def __init__(self, output, algorithms=("md5", "sha1")):
+        """ Write a hashdeep style hash set, with the file size and multiple
+            hashes of each file. Files that only have some of the hashes are
+            skipped, and counted so a warning can be given. """
+        self.algorithms = tuple(algorithms)
+        self.output = output
+        self.skipped = 0
+        self.fields = ("filename", "filesize") + self.algorithms
+        self.out = open_output(output)
+        self.out.write("%%%% HASHDEEP-1.0\n")
+        self.out.write("%%%%%%%% size,%s,filename\n" % ",".join(self.algorithms))
+        self.out.write("## Invoked from: %s\n" % os.getcwd())
+        self.out.write("## $ %s\n" % " ".join(sys.argv))
+        self.out.write("##\n")
+
+    def write(self, record):
+        digests = [record[algorithm] for algorithm in self.algorithms]
+        if not all(digests) or not record["filesize"]:
+            if any(digests):
+                self.skipped += 1
+            return
+        self.out.write("%s,%s,%s\n" % (record["filesize"], ",".join(digests), record["filename"]))
+
+    def close(self):
+        self.out.close()
+        if self.skipped:
+            sys.stderr.write("Warning: %d files without all of the %s hashes were not written to %s\n" %
+                             (self.skipped, ",".join(self.algorithms), self.output or "stdout"))
+
+    def abort(self):
+        self.out.close()
+        remove_output(self.output)
+
+class NSRLWriter:
+    # Column names of the NSRL RDS NSRLFile.txt format
+    HEADER = ["SHA-1", "MD5", "CRC32", "FileName", "FileSize",
+              "ProductCode", "OpSystemCode", "SpecialCode"]
+
+    def __init__(self, output, product_code=0, os_code=""):
+        """ Write an NSRL RDS style CSV hash set. CRC32 values are not
+            available in DFXML, so the column is left empty. """
+        self.fields = ("filename", "filesize", "sha1", "md5")
+        self.product_code = product_code
+        self.os_code = os_code
+        self.output = output
+        self.out = open_output(output)
+        self.csv = csv.writer(self.out, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+        self.csv.writerow(self.HEADER)
+
+    def write(self, record):
+        if not record["sha1"]:
+            return
+        try:
+            filesize = int(record["filesize"])
+        except (TypeError, ValueError):
+            filesize = 0
+        self.csv.writerow([record["sha1"].upper(),
+                           (record["md5"] or "").upper(),
+                           "",
+                           os.path.basename(record["filename"] or ""),
+                           filesize,
+                           self.product_code,
+                           self.os_code,
+                           ""])
+
+    def close(self):
+        self.out.close()
+
+    def abort(self):
+        self.out.close()
+        remove_output(self.output)
+
+class BinaryHashSetWriter:
+    def __init__(self, output, algorithm="sha1"):
+        """ Write a sorted, deduplicated binary hash set. """
+        self.algorithm = algorithm
+        self.fields = (algorithm,)
+        self.hashes = hashset.SortedHashSetWriter(output, algorithm)
+
+    def write(self, record):
+        if record[self.algorithm]:
+            self.hashes.add(record[self.algorithm])
+
+    def close(self):
+        self.hashes.close()
+
+    def abort(self):
+        self.hashes.abort()
 
 ################################################################################
 if __name__=='__main__':
@@ -65,8 +233,67 @@ if __name__=='__main__':
     parser = argparse.ArgumentParser(description="""
 DFXML2sha1deep.py is a script that converts a DFXML report to the sha1deep
 (part of the hashdeep toolset) format. The hash set is printed to standard
-output (stdout), so redirect to a file to save the convereted hash set.""")
+output (stdout), so redirect to a file to save the convereted hash set.
+Other hash set formats can be written at the same time, from one pass over
+the DFXML report.""")
     parser.add_argument("dfxml",
                         help = "Target DFXML report")
+    parser.add_argument("-o",
+                        metavar = "OUTPUT",
+                        help = "Output sha1deep hash set (default: stdout, unless other formats are requested)")
+    parser.add_argument("--md5deep",
+                        metavar = "OUTPUT",
+                        help = "Output md5deep hash set")
+    parser.add_argument("--sha256deep",
+                        metavar = "OUTPUT",
+                        help = "Output sha256deep hash set")
+    parser.add_argument("--hashdeep",
+                        metavar = "OUTPUT",
+                        help = "Output hashdeep hash set (size and multiple hashes)")
+    parser.add_argument("--hashdeep-hashes",
+                        metavar = "HASHES",
+                        help = "Comma separated hashes for --hashdeep (default: md5,sha1, as written by fiwalk)",
+                        default = "md5,sha1")
+    parser.add_argument("--nsrl",
+                        metavar = "OUTPUT",
+                        help = "Output NSRL RDS style CSV hash set")
+    parser.add_argument("--binary",
+                        metavar = "OUTPUT",
+                        help = "Output sorted, deduplicated binary hash set")
+    parser.add_argument("--binary-hash",
+                        help = "Hash algorithm for --binary (default: sha1)",
+                        choices = sorted(hashset.DIGEST_SIZES.keys()),
+                        default = "sha1")
+    parser.add_argument("-j", "--jobs",
+                        metavar = "N",
+                        help = "Number of processes used to parse the DFXML report (default: 1)",
+                        type = int,
+                        default = 1)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
-    process_dfxml(args.dfxml)
+
+    # Validate options before any output file is opened
+    algorithms = [name.strip().lower() for name in args.hashdeep_hashes.split(",") if name.strip()]
+    for algorithm in algorithms:
+        if algorithm not in fastparse.HASH_FIELDS:
+            parser.error("Unsupported hashdeep hash: %s" % algorithm)
+
+    writers = list()
+    if args.md5deep:
+        writers.append(HashListWriter(args.md5deep, "md5"))
+    if args.sha256deep:
+        writers.append(HashListWriter(args.sha256deep, "sha256"))
+    if args.hashdeep:
+        writers.append(HashDeepWriter(args.hashdeep, algorithms))
+    if args.nsrl:
+        writers.append(NSRLWriter(args.nsrl))
+    if args.binary:
+        writers.append(BinaryHashSetWriter(args.binary, args.binary_hash))
+    # The sha1deep hash set is written to stdout by default
+    if args.o or not writers:
+        writers.insert(0, HashListWriter(args.o, "sha1"))
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
+    try:
+        process_dfxml(args.dfxml, writers, args.jobs, stats)
+    finally:
+        stats.close()
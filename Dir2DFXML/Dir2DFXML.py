@@ -28,19 +28,29 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 >>> CHANGELOG:
     0.1.0       Base functionality
+    0.2.0       Single pass, chunked multi-digest hashing (-d)
+    0.3.0       Parallel hashing using a worker pool (--jobs)
+    0.4.0       Incremental re-scan using a SQLite hash cache (--cache)
+    0.5.0       Stream DFXML report to stdout or a file (-o)
+    0.6.0       scandir based directory walker with filtering options
+    0.7.0       Piecewise hashing recorded as byte runs (-p)
+    0.8.0       Throughput statistics and profiling (--stats, --profile)
 
 """
 
-__version__ = "0.1.0"
+__version__ = "0.8.0"
 
 import sys
 import os
-import hashlib
+import stat
+import fnmatch
 import datetime
 import platform
-import glob
-import io
-import xml.dom.minidom
+import time
+import sqlite3
+import threading
+import collections
+import concurrent.futures
 
 sys.path.append(r'../dfxml/python')
 try:
@@ -51,9 +61,31 @@ except ImportError:
     print('Now Exiting...')
     sys.exit(1)
 
+sys.path.append(r'../common')
+import hashing
+import dfxmlwriter
+import instrument
+
+# Number of files queued per worker when hashing in parallel
+IN_FLIGHT_PER_JOB = 4
+
+# Digests a DFXML byte run can record (piecewise mode)
+BYTE_RUN_DIGESTS = ("md5", "sha1")
+
+# Number of cache updates between commits
+CACHE_COMMIT_INTERVAL = 1000
+
+# SQL condition for a cache entry that matches the file being stored
+CACHE_ENTRY_CURRENT = ("size = excluded.size AND mtime_ns = excluded.mtime_ns "
+                       "AND ctime_ns = excluded.ctime_ns")
+
 ################################################################################
-def process_directory(target_dir, recursive, basename):
+def process_directory(target_dir, recursive, basename, digests=hashing.DEFAULT_DIGESTS, jobs=1,
+                      cache=None, verify=False, output=None, walk_options=None, piece_size=None,
+                      stats=None):
     """ Process the target directory and produce DFXML report. """
+    if stats is None:
+        stats = instrument.Stats(os.path.basename(__file__))
     dc = {"name" : os.path.basename(__file__),
           "type" : "Hash List",
           "date" : datetime.datetime.now().isoformat(),
@@ -66,47 +98,240 @@ def process_directory(target_dir, recursive, basename):
     dfxml = Objects.DFXMLObject(command_line = " ".join(sys.argv),
                                 sources = [target_dir],
                                 dc = dc)
-    fis = list()
-    # Scan for files recursively if specified
-    if recursive:
-        for root, dirnames, filenames in os.walk(target_dir):
-            for filename in filenames:
-                fis.append(os.path.join(root, filename))
+    # Write each FileObject to the report (default: stdout) as it is produced
+    fis = stats.iterate(walk_directory(target_dir, recursive, **(walk_options or {})), "walk")
+    with dfxmlwriter.DFXMLWriter(output, dfxml) as writer:
+        for fo in iter_fileobjects(fis, basename, digests, jobs, cache, verify, piece_size, stats):
+            with stats.phase("serialize"):
+                writer.append(fo)
+            stats.count(files=1)
+
+def walk_directory(target_dir, recursive, max_depth=None, include=None, exclude=None,
+                   symlinks=True, special=False):
+    """ Generator. Yields a (path, stat result) tuple for each file in the
+        target directory, using os.scandir so that each file is only
+        stat'ed once. Files in a directory are yielded before the files in
+        its subdirectories (the same order as os.walk).
+        max_depth: Number of subdirectory levels to descend (None: no limit)
+        include: Glob patterns, only matching files are included
+        exclude: Glob patterns, matching files and directories are skipped
+        symlinks: Include symbolic links to files (the target is hashed)
+        special: Include special files (FIFOs, sockets and devices) """
+    if not recursive and max_depth is None:
+        max_depth = 0
+    # Stack of (directory, depth), popped from the end
+    pending = [(target_dir, 0)]
+    while pending:
+        (directory, depth) = pending.pop()
+        subdirs = list()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            sys.stderr.write("Warning: Cannot read directory: %s (%s)\n" % (directory, e.strerror))
+            continue
+        with entries:
+            for entry in entries:
+                relpath = os.path.relpath(entry.path, target_dir)
+                if exclude and _match_any(entry.name, relpath, exclude):
+                    continue
+                try:
+                    # Symbolic links to directories are never followed
+                    if entry.is_dir(follow_symlinks=False):
+                        if max_depth is None or depth < max_depth:
+                            subdirs.append(entry.path)
+                        continue
+                    is_link = entry.is_symlink()
+                    if is_link and not symlinks:
+                        continue
+                    if include and not _match_any(entry.name, relpath, include):
+                        continue
+                    st = entry.stat(follow_symlinks=is_link)
+                except OSError:
+                    # Broken symbolic link, or file removed during the walk
+                    continue
+                if stat.S_ISREG(st.st_mode) or (special and not stat.S_ISDIR(st.st_mode)):
+                    yield (entry.path, st)
+        for subdir in reversed(subdirs):
+            pending.append((subdir, depth + 1))
+
+def _match_any(name, relpath, patterns):
+    """ Helper method to match a file name or relative path to glob patterns. """
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern):
+            return True
+    return False
+
+def process_file(fi, st, basename, digests, cache=None, verify=False, piece_size=None,
+                 stats=None):
+    """ Create a populated FileObject for a single file. Digests are taken
+        from the hash cache (if supplied) when the file is unchanged. Only
+        regular files are hashed. If piece_size is set, the digest of each
+        piece is recorded as a byte run (the cache is not used). Hashing
+        time and bytes are added to stats (if supplied). """
+    fo = Objects.FileObject()
+    # Only include basename if requested
+    if basename:
+        fo.filename = os.path.basename(fi)
     else:
-        fis = glob.glob(target_dir + "/*")
-    for fi in fis:
-        if os.path.isfile(fi):
-            fo = Objects.FileObject()
-            # Only include basename if requested
-            if basename:
-                fo.filename = os.path.basename(fi)
-            else:
-                fo.filename = fi
-            # Populate the FileObject using a os.stat() call
-            fo.populate_from_stat(os.stat(fi))
-            fo.sha1 = sha1_file(fi)
-            fo.md5 = md5_file(fi)
-            dfxml.append(fo)
-    # Write a temp DFXML file, format it, then print to stdout
-    temp_fi = io.StringIO(dfxml.to_dfxml())
-    xml_fi = xml.dom.minidom.parse(temp_fi)
-    print(xml_fi.toprettyxml(indent="  "))
-
-def sha1_file(fi):
-    """ Helper method to calculate SHA-1 hash of a data file. """
-    hasher = hashlib.sha1()
-    with open(fi, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
-
-def md5_file(fi):
-    """ Helper method to calculate MD5 hash of a data file. """
-    hasher = hashlib.md5()
-    with open(fi, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
+        fo.filename = fi
+    # Populate the FileObject using the stat result from the walk
+    fo.populate_from_stat(st)
+    if not stat.S_ISREG(st.st_mode):
+        return fo
+    if piece_size:
+        start = time.perf_counter()
+        (hashes, pieces) = hashing.hash_file_piecewise(fi, piece_size, digests)
+        if stats is not None:
+            stats.add_time("hash", time.perf_counter() - start)
+            stats.count(bytes_hashed=st.st_size)
+        if cache is not None:
+            cache.store(st, hashes)
+        for (name, value) in hashes.items():
+            setattr(fo, name, value)
+        fo.byte_runs = piecewise_byte_runs(pieces)
+        return fo
+    hashes = None
+    if cache is not None:
+        hashes = cache.lookup(st, digests)
+    if hashes is None or verify:
+        # Calculate all requested digests in one read of the file
+        cached = hashes
+        start = time.perf_counter()
+        hashes = hashing.hash_file(fi, digests)
+        if stats is not None:
+            stats.add_time("hash", time.perf_counter() - start)
+            stats.count(bytes_hashed=st.st_size)
+        if cached is not None and cached != hashes:
+            sys.stderr.write("Warning: Content changed but metadata did not: %s\n" % fi)
+        if cache is not None:
+            cache.store(st, hashes)
+    for (name, value) in hashes.items():
+        setattr(fo, name, value)
+    return fo
+
+def piecewise_byte_runs(pieces):
+    """ Helper method to convert hashed pieces to DFXML byte runs. Only the
+        BYTE_RUN_DIGESTS are recorded, as ByteRun has no other hash
+        properties (e.g. no sha256). """
+    run_list = list()
+    for (offset, length, hashes) in pieces:
+        byte_run = Objects.ByteRun(file_offset=offset, len=length)
+        for name in BYTE_RUN_DIGESTS:
+            if name in hashes:
+                setattr(byte_run, name, hashes[name])
+        run_list.append(byte_run)
+    return Objects.ByteRuns(run_list = run_list)
+
+def parse_size(value):
+    """ Helper method to parse a size with an optional k, m or g suffix. """
+    units = {"k" : 1024, "m" : 1024 ** 2, "g" : 1024 ** 3}
+    value = value.strip().lower()
+    multiplier = 1
+    if value and value[-1] in units:
+        multiplier = units[value[-1]]
+        value = value[:-1]
+    size = int(value) * multiplier
+    if size <= 0:
+        raise ValueError("size must be greater than zero")
+    return size
+
+def iter_fileobjects(fis, basename, digests, jobs=1, cache=None, verify=False, piece_size=None,
+                     stats=None):
+    """ Generator. Yields a FileObject for each file, in the same order as
+        the input (path, stat result) tuples. If jobs is greater than one the files are hashed
+        in a thread pool (hashlib releases the GIL while hashing), with at
+        most IN_FLIGHT_PER_JOB files queued per worker. """
+    if jobs <= 1:
+        for (fi, st) in fis:
+            yield process_file(fi, st, basename, digests, cache, verify, piece_size, stats)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = collections.deque()
+        for (fi, st) in fis:
+            pending.append(pool.submit(process_file, fi, st, basename, digests, cache, verify,
+                                       piece_size, stats))
+            if len(pending) >= jobs * IN_FLIGHT_PER_JOB:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+################################################################################
+class HashCache:
+    """ Persistent SQLite cache of file digests. Each entry is keyed on the
+        device and inode of a file, and is only reused while the size,
+        mtime and ctime of the file still match. """
+    def __init__(self, path, max_age=30):
+        self.path = path
+        self.max_age = max_age
+        self.run_time = int(time.time())
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS hashes (
+                             device INTEGER NOT NULL,
+                             inode INTEGER NOT NULL,
+                             size INTEGER NOT NULL,
+                             mtime_ns INTEGER NOT NULL,
+                             ctime_ns INTEGER NOT NULL,
+                             md5 TEXT,
+                             sha1 TEXT,
+                             sha256 TEXT,
+                             last_seen INTEGER NOT NULL,
+                             PRIMARY KEY (device, inode))""")
+
+    def lookup(self, st, digests):
+        """ Return cached digests for a stat result, or None if the file has
+            changed or any requested digest is missing. """
+        with self.lock:
+            row = self.conn.execute("""SELECT size, mtime_ns, ctime_ns, md5, sha1, sha256
+                                       FROM hashes WHERE device = ? AND inode = ?""",
+                                    (st.st_dev, st.st_ino)).fetchone()
+            if row is None or row[:3] != (st.st_size, st.st_mtime_ns, st.st_ctime_ns):
+                self.misses += 1
+                return None
+            cached = dict(zip(hashing.SUPPORTED_DIGESTS, row[3:]))
+            if any(cached[name] is None for name in digests):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE hashes SET last_seen = ? WHERE device = ? AND inode = ?",
+                              (self.run_time, st.st_dev, st.st_ino))
+            self._updated()
+            self.hits += 1
+            return dict((name, cached[name]) for name in digests)
+
+    def store(self, st, hashes):
+        """ Store the digests for a stat result, replacing any stale entry
+            for the same device and inode. Digests not calculated in this
+            run are kept from an entry that is still current. """
+        with self.lock:
+            self.conn.execute("""INSERT INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT (device, inode) DO UPDATE SET
+                                 md5 = CASE WHEN %(current)s THEN COALESCE(excluded.md5, md5) ELSE excluded.md5 END,
+                                 sha1 = CASE WHEN %(current)s THEN COALESCE(excluded.sha1, sha1) ELSE excluded.sha1 END,
+                                 sha256 = CASE WHEN %(current)s THEN COALESCE(excluded.sha256, sha256) ELSE excluded.sha256 END,
+                                 size = excluded.size,
+                                 mtime_ns = excluded.mtime_ns,
+                                 ctime_ns = excluded.ctime_ns,
+                                 last_seen = excluded.last_seen""" % {"current" : CACHE_ENTRY_CURRENT},
+                              (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+                               hashes.get("md5"), hashes.get("sha1"), hashes.get("sha256"),
+                               self.run_time))
+            self._updated()
+
+    def _updated(self):
+        self.updates += 1
+        if self.updates % CACHE_COMMIT_INTERVAL == 0:
+            self.conn.commit()
+
+    def close(self):
+        """ Evict entries not seen within max_age days, then save the cache. """
+        with self.lock:
+            expiry = self.run_time - (self.max_age * 86400)
+            self.conn.execute("DELETE FROM hashes WHERE last_seen < ?", (expiry,))
+            self.conn.commit()
+            self.conn.close()
 
 ################################################################################
 if __name__=='__main__':
@@ -118,8 +343,80 @@ Dir2DFXML.py is a script that creates a DFXML report from a directory.""")
     parser.add_argument("-r",
                         help = "Recursively scan",
                         action = "store_true")
+    parser.add_argument("--max-depth",
+                        metavar = "N",
+                        help = "Descend at most N directory levels (implies -r)",
+                        type = int)
+    parser.add_argument("--include",
+                        metavar = "GLOB",
+                        help = "Only include files matching the glob pattern (can be repeated)",
+                        action = "append")
+    parser.add_argument("--exclude",
+                        metavar = "GLOB",
+                        help = "Skip files and directories matching the glob pattern (can be repeated)",
+                        action = "append")
+    parser.add_argument("--no-symlinks",
+                        help = "Skip symbolic links to files (default: hash the link target)",
+                        action = "store_true")
+    parser.add_argument("--special",
+                        help = "Include special files (FIFOs, sockets and devices), without hashing",
+                        action = "store_true")
     parser.add_argument("-b",
                         help = "Only store file basename",
                         action = "store_true")
+    parser.add_argument("-d",
+                        metavar = "DIGESTS",
+                        help = "Comma separated digests to calculate (default: sha1,md5; supported: md5,sha1,sha256)",
+                        default = ",".join(hashing.DEFAULT_DIGESTS))
+    parser.add_argument("-p",
+                        metavar = "SIZE",
+                        help = "Piecewise mode, also hash each SIZE block (e.g. 1m) and record it as a byte run (md5 and sha1 only)")
+    parser.add_argument("-j", "--jobs",
+                        metavar = "N",
+                        help = "Number of files to hash in parallel (default: 1)",
+                        type = int,
+                        default = 1)
+    parser.add_argument("-o",
+                        metavar = "OUTPUT",
+                        help = "Output DFXML report (default: stdout)")
+    parser.add_argument("--cache",
+                        metavar = "CACHE",
+                        help = "SQLite hash cache, reused when a file's inode, size, mtime and ctime are unchanged")
+    parser.add_argument("--cache-max-age",
+                        metavar = "DAYS",
+                        help = "Evict cache entries not seen for this many days (default: 30)",
+                        type = int,
+                        default = 30)
+    parser.add_argument("--verify",
+                        help = "Rehash every file, even if a cached digest is available",
+                        action = "store_true")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
-    process_directory(args.directory, args.r, args.b)
+    try:
+        digests = hashing.parse_digests(args.d)
+    except ValueError as e:
+        parser.error(str(e))
+    piece_size = None
+    if args.p:
+        try:
+            piece_size = parse_size(args.p)
+        except ValueError:
+            parser.error("Invalid piece size: %s" % args.p)
+        if not any(name in digests for name in BYTE_RUN_DIGESTS):
+            sys.stderr.write("Warning: Byte runs only record md5 and sha1, pieces will not be hashed in the report\n")
+    walk_options = {"max_depth" : args.max_depth,
+                    "include" : args.include,
+                    "exclude" : args.exclude,
+                    "symlinks" : not args.no_symlinks,
+                    "special" : args.special}
+    cache = None
+    if args.cache:
+        cache = HashCache(args.cache, args.cache_max_age)
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
+    try:
+        process_directory(args.directory, args.r, args.b, digests, args.jobs,
+                          cache, args.verify, args.o, walk_options, piece_size, stats)
+    finally:
+        if cache is not None:
+            cache.close()
+        stats.close()
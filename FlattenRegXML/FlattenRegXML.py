@@ -32,16 +32,51 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 >>> CHANGELOG:
     0.1.0       Base functionality
+    0.2.0       Read compressed RegXML reports (.gz, .bz2 or .xz)
+    0.3.0       Throughput statistics and profiling (--stats, --profile)
+    0.4.0       Constant memory streaming output (--stream, -o, --bloom-keys)
 
 """
 
 import os
 import sys
+import hashlib
 sys.path.append(r'../dfxml/python')
 import dfxml
 import Objects
+sys.path.append(r'../common')
+import compressed
+import instrument
+import hashset
+import dfxmlwriter
 
-__version__ = "0.1.0"
+__version__ = "0.4.0"
+
+# Size in bytes of the hash of each key path used to detect duplicate keys
+KEY_PATH_HASH_SIZE = 16
+
+class KeyPathIndex:
+    def __init__(self, bloom_keys=None):
+        """ Detect duplicate key paths without keeping the keys. Hashes of
+            the key paths are kept in a set, or if bloom_keys is given, in a
+            fixed size Bloom filter for that many keys (in which case a
+            duplicate is only probable). """
+        self.hashes = set()
+        self.bloom = None
+        if bloom_keys is not None:
+            self.bloom = hashset.BloomFilter(bloom_keys)
+        self.exact = self.bloom is None
+
+    def add(self, cellpath):
+        """ Add a key path. Returns True if it was (probably) already added. """
+        digest = hashlib.blake2b(cellpath.encode("utf-8", "surrogatepass"),
+                                 digest_size=KEY_PATH_HASH_SIZE).digest()
+        if self.bloom is not None:
+            return self.bloom.add(digest)
+        if digest in self.hashes:
+            return True
+        self.hashes.add(digest)
+        return False
 
 class xml_reader:
     def __init__(self):
@@ -66,12 +101,13 @@ class xml_reader:
         p.ParseFile(xml_stream)
 
 class regxml_reader_Objects(xml_reader):
-    def __init__(self,flags=None):
+    def __init__(self,flags=None,index=None):
         self.flags = flags
         xml_reader.__init__(self)
         self.objectstack = []
         self.registry_object = None
         self.nonce = 0
+        self.index = index if index is not None else KeyPathIndex()
 
     def _start_element(self, name, attrs):
         new_object = None
@@ -190,11 +226,13 @@ class regxml_reader_Objects(xml_reader):
             pass
         elif name in ["key","node"]:
             finished_object = self.objectstack.pop()
-            #Add finished object to object index
-            if finished_object.cellpath in self.registry_object.object_index:
-                raise ValueError("regxml_reader_Objects._end_element:  Same key path found more than once: " +
-                                 finished_object.cellpath)
-            self.registry_object.object_index[finished_object.cellpath] = finished_object
+            #Add finished key path to index (the object itself is not kept)
+            if self.index.add(finished_object.cellpath):
+                if self.index.exact:
+                    raise ValueError("regxml_reader_Objects._end_element:  Same key path found more than once: " +
+                                     finished_object.cellpath)
+                sys.stderr.write("Warning: Key path possibly found more than once: " +
+                                 finished_object.cellpath + "\n")
             self.callback(finished_object)
         elif name in ["mtime"]:
             self.objectstack[-1].mtime = dfxml.dftime(self.cdata)
@@ -215,40 +253,90 @@ class regxml_reader_Objects(xml_reader):
         else:
             raise ValueError("regxml_reader_Objects._end_element: Don't know how to end element %s.\n" % name)
 
-def read_regxml_Objects(xmlfile=None,flags=0,callback=None):
+def read_regxml_Objects(xmlfile=None,flags=0,callback=None,index=None):
     """Processes an image using expat, calling a callback for node encountered."""
     import xml.parsers.expat
     if not callback:
         raise ValueError("callback must be specified")
     if not xmlfile:
         raise ValueError("regxml file must be specified")
-    r = regxml_reader(flags=flags)
+    r = regxml_reader_Objects(flags=flags,index=index)
     try:
         r.process_xml_stream(xmlfile,callback)
     except xml.parsers.expat.ExpatError as e:
-        stderr.write("XML parsing error for file \"" + xmlfile.name + "\".  Object stack:\n")
+        sys.stderr.write("XML parsing error for file \"" + xmlfile.name + "\".  Object stack:\n")
         for x in r.objectstack:
-            stderr.write(str(x) + "\n")
-        stderr.write("(Done.)\n")
+            sys.stderr.write(str(x) + "\n")
+        sys.stderr.write("(Done.)\n")
         raise e
     return r
 
 def cell_callback(cell):
     hive.append(cell)
+    stats.count(cells=1)
+
+def stream_callback(cell):
+    writer.append(cell)
+    stats.count(cells=1)
 
 if __name__=="__main__":
     import argparse
+    import xml.parsers.expat
     parser = argparse.ArgumentParser(description='''FlattenRegXML.py''')
     parser.add_argument("regxml",
                         help = "Target RegXML file")
+    parser.add_argument("-o", "--output",
+                        metavar = "FILE",
+                        help = "Output RegXML file, compressed if FILE ends in .gz, .bz2 or .xz (default: stdout)")
+    parser.add_argument("--stream",
+                        help = "Write each cell as soon as it is parsed, so memory use does not grow with hive size",
+                        action = "store_true",
+                        default = False)
+    parser.add_argument("--bloom-keys",
+                        metavar = "N",
+                        help = "Detect duplicate key paths using a fixed size Bloom filter for N keys (duplicates are then reported as warnings, as they are only probable)",
+                        type = int)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    if args.bloom_keys is not None and args.bloom_keys < 1:
+        parser.error("--bloom-keys must be at least 1")
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
 
     regxml_filename = args.regxml
     regxml = Objects.RegXMLObject(command_line = " ".join(sys.argv),                              program = os.path.basename(__file__),                              program_version = __version__)
     hive = Objects.HiveObject(filename = regxml_filename)
+    index = KeyPathIndex(args.bloom_keys)
+
+    if args.stream:
+        # The (empty) hive is written around the cells as they are parsed
+        regxml.append(hive)
+        # On error the footer is not written, so the output is not well formed
+        try:
+            with dfxmlwriter.RegXMLWriter(args.output, regxml) as writer:
+                with compressed.open_input(regxml_filename) as xmlfile:
+                    with stats.phase("parse"):
+                        read_regxml_Objects(xmlfile = instrument.CountingReader(xmlfile, stats),
+                                            callback = stream_callback,
+                                            index = index)
+        except (ValueError, xml.parsers.expat.ExpatError) as e:
+            sys.stderr.write("Error: %s\n" % e)
+            sys.stderr.write("The RegXML output is incomplete\n")
+            stats.close()
+            sys.exit(1)
+        stats.close()
+        sys.exit(0)
 
-    read_regxml_Objects(xmlfile = open(regxml_filename, 'rb'),
-                        callback = cell_callback)
+    with compressed.open_input(regxml_filename) as xmlfile:
+        with stats.phase("parse"):
+            read_regxml_Objects(xmlfile = instrument.CountingReader(xmlfile, stats),
+                                callback = cell_callback,
+                                index = index)
 
     regxml.append(hive)
-    print(regxml.to_regxml())
+    with stats.phase("serialize"):
+        if args.output is None:
+            print(regxml.to_regxml())
+        else:
+            with compressed.open_output(args.output) as f:
+                f.write(regxml.to_regxml() + "\n")
+    stats.close()
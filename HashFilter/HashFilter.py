@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+HashFilter.py is a script that filters the fileobjects in a DFXML report
+against a large known hash set (e.g. NSRL known-good or a known-bad list).
+Hash lists are first compiled to a sorted binary hash set, with an optional
+Bloom filter, which is memory mapped when filtering so there is no load
+cost. Matched and unmatched fileobjects are written as DFXML reports.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Throughput statistics and profiling (--stats, --profile)
+
+"""
+
+__version__ = "0.2.0"
+
+import sys
+import os
+import re
+import datetime
+import platform
+
+sys.path.append(r'../dfxml/python')
+try:
+    import Objects
+except ImportError:
+    print('Error: The DFXML Objects.py module is required to run this program')
+    print('You can download from: https://github.com/simsong/dfxml')
+    print('Now Exiting...')
+    sys.exit(1)
+
+sys.path.append(r'../common')
+import dfxmlwriter
+import fileobjects
+import compressed
+import hashset
+import instrument
+
+# File name extension of the Bloom filter written next to a hash set
+BLOOM_EXTENSION = ".bloom"
+
+################################################################################
+def iter_hashes(path, algorithm):
+    """ Generator. Yields the first hex digest of the requested algorithm on
+        each line of a hash list. This reads plain hash lists, md5deep and
+        sha1deep output, hashdeep output and NSRL RDS CSV files. """
+    width = hashset.DIGEST_SIZES[algorithm] * 2
+    pattern = re.compile(rb"(?<![0-9A-Fa-f])[0-9A-Fa-f]{%d}(?![0-9A-Fa-f])" % width)
+    with compressed.open_input(path) as f:
+        for line in f:
+            match = pattern.search(line)
+            if match:
+                yield match.group(0).decode('ascii')
+
+def compile_hashset(hashlists, output, algorithm="sha1", bloom=False, stats=None):
+    """ Compile hash lists to a sorted, deduplicated binary hash set, and
+        optionally a Bloom filter (output + .bloom). """
+    if stats is None:
+        stats = instrument.Stats(os.path.basename(__file__))
+    print('\n>>> Compiling hash set: %s' % output)
+    added = 0
+    with hashset.SortedHashSetWriter(output, algorithm) as writer:
+        for hashlist in hashlists:
+            print("    Reading hash list: %s" % hashlist)
+            for hexdigest in stats.iterate(iter_hashes(hashlist, algorithm), "parse"):
+                if writer.add(hexdigest):
+                    added += 1
+                    stats.count(hashes=1)
+        with stats.phase("sort"):
+            writer.close()
+    print("    Read %d hashes, %d unique" % (added, writer.count))
+    if bloom:
+        with stats.phase("bloom"), hashset.HashSetReader(output) as reader:
+            bits = hashset.write_bloom_filter(output + BLOOM_EXTENSION, reader)
+        print("    Bloom filter: %s (%d bytes)" % (output + BLOOM_EXTENSION, bits // 8))
+    return writer.count
+
+class HashFilter:
+    def __init__(self, hashsetfile, xmlfile, matched=None, unmatched=None, bloom=None,
+                 stats=None):
+        """ Filter the fileobjects in a DFXML report against a binary hash
+            set. Fileobjects without the hash set's hash are unmatched. If
+            bloom is None, the Bloom filter is used if it exists. """
+        self.hashsetfile = hashsetfile
+        self.xmlfile = xmlfile
+        self.matched = matched
+        self.unmatched = unmatched
+        self.hashes = hashset.HashSetReader(hashsetfile)
+        self.bloom = None
+        bloomfile = hashsetfile + BLOOM_EXTENSION
+        if bloom or (bloom is None and os.path.exists(bloomfile)):
+            self.bloom = hashset.BloomFilterReader(bloomfile, self.hashes.count)
+        # Progress goes to stderr if a report is written to stdout
+        self.log = sys.stderr if "-" in (matched, unmatched) else sys.stdout
+        self.stats = stats or instrument.Stats(os.path.basename(__file__))
+        self.target_fi_count = 0
+        self.matched_count = 0
+        self.unmatched_count = 0
+        self.missing_count = 0
+
+    def process_dfxml(self):
+        """ Process the target DFXML report. The hash is read from each
+            fileobject Element, and a FileObject is only built if it is
+            written to a report. """
+        print('\n>>> Processing target DFXML report ...', file=self.log)
+        algorithm = self.hashes.algorithm
+        writers = {True : self.open_report(self.matched, "Matched"),
+                   False : self.open_report(self.unmatched, "Unmatched")}
+        source = instrument.CountingReader(compressed.open_input(self.xmlfile), self.stats)
+        try:
+            elems = fileobjects.iter_fileobject_elements(source)
+            for elem in self.stats.iterate(elems, "parse"):
+                self.target_fi_count += 1
+                self.stats.count(files=1)
+                with self.stats.phase("match"):
+                    found = self.lookup(_hashdigest(elem, algorithm))
+                writer = writers[found]
+                if writer is not None:
+                    with self.stats.phase("serialize"):
+                        fi = Objects.FileObject()
+                        fi.populate_from_Element(elem)
+                        writer.append(fi)
+        except BaseException:
+            # Reports of a partly processed DFXML report are not finished
+            for writer in writers.values():
+                if writer is not None:
+                    writer.abort()
+            raise
+        else:
+            for writer in writers.values():
+                if writer is not None:
+                    writer.close()
+        finally:
+            source.close()
+            self.hashes.close()
+            if self.bloom is not None:
+                self.bloom.close()
+        print("    Matched: %d" % self.matched_count, file=self.log)
+        print("    Unmatched: %d (%d without a %s hash)" %
+              (self.unmatched_count, self.missing_count, algorithm), file=self.log)
+
+    def lookup(self, hexdigest):
+        """ Return True if a hex digest is in the hash set. """
+        if hexdigest is None:
+            self.missing_count += 1
+            self.unmatched_count += 1
+            return False
+        try:
+            digest = bytes.fromhex(hexdigest)
+        except ValueError:
+            digest = b""
+        found = ((self.bloom is None or digest in self.bloom) and digest in self.hashes)
+        if found:
+            self.matched_count += 1
+        else:
+            self.unmatched_count += 1
+        return found
+
+    def open_report(self, output, name):
+        """ Start a DFXML report of matched or unmatched fileobjects. """
+        if output is None:
+            return None
+        dc = {"name" : os.path.basename(__file__),
+              "type" : "%s Files" % name,
+              "date" : datetime.datetime.now().isoformat(),
+              "os_sysname" : platform.system(),
+              "os_release" : platform.release(),
+              "os_version" : platform.version(),
+              "os_host" : platform.node(),
+              "os_arch" : platform.machine()}
+        dfxml = Objects.DFXMLObject(command_line = " ".join(sys.argv),
+                                    sources = [self.xmlfile, self.hashsetfile],
+                                    dc = dc)
+        print("    %s DFXML report: %s" % (name, output), file=self.log)
+        return dfxmlwriter.DFXMLWriter(output, dfxml)
+
+def _hashdigest(elem, algorithm):
+    """ Helper method to return a hash of a fileobject Element, or None. """
+    for child in elem:
+        if (child.tag.rsplit("}", 1)[-1] == "hashdigest" and
+            child.get("type", "").lower() == algorithm and child.text):
+            return child.text.strip()
+    return None
+
+################################################################################
+if __name__=='__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="""
+HashFilter.py is a script that filters the fileobjects in a DFXML report
+against a known hash set. Hash lists (plain, md5deep/sha1deep, hashdeep or
+NSRL RDS CSV) are compiled to a binary hash set with the compile command,
+then DFXML reports are filtered with the filter command.""")
+    subparsers = parser.add_subparsers(dest = "command")
+    subparsers.required = True
+    compile_parser = subparsers.add_parser("compile",
+                                           help = "Compile hash lists to a binary hash set")
+    compile_parser.add_argument("hashlists",
+                                help = "Hash lists to compile",
+                                nargs = "+")
+    compile_parser.add_argument("-o",
+                                metavar = "OUTPUT",
+                                help = "Output binary hash set (e.g. nsrl.hs)",
+                                required = True)
+    compile_parser.add_argument("--hash",
+                                help = "Hash algorithm of the hash set (default: sha1)",
+                                choices = sorted(hashset.DIGEST_SIZES.keys()),
+                                default = "sha1")
+    compile_parser.add_argument("--bloom",
+                                help = "Also write a Bloom filter (OUTPUT.bloom)",
+                                action = "store_true")
+    filter_parser = subparsers.add_parser("filter",
+                                          help = "Filter a DFXML report using a binary hash set")
+    filter_parser.add_argument("hashset",
+                               help = "Binary hash set (from compile, or DFXML2sha1deep --binary)")
+    filter_parser.add_argument("dfxml",
+                               help = "Target DFXML report")
+    filter_parser.add_argument("--matched",
+                               metavar = "OUTPUT",
+                               help = "Output DFXML report of fileobjects in the hash set")
+    filter_parser.add_argument("--unmatched",
+                               metavar = "OUTPUT",
+                               help = "Output DFXML report of fileobjects not in the hash set")
+    filter_parser.add_argument("--no-bloom",
+                               help = "Do not use the Bloom filter, even if it exists",
+                               action = "store_true")
+    for subparser in (compile_parser, filter_parser):
+        instrument.add_arguments(subparser)
+    args = parser.parse_args()
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
+
+    if args.command == "compile":
+        try:
+            compile_hashset(args.hashlists, args.o, args.hash, args.bloom, stats)
+        finally:
+            stats.close()
+        sys.exit(0)
+
+    if args.matched is None and args.unmatched is None:
+        filter_parser.error("at least one of --matched or --unmatched is required")
+    try:
+        hashfilter = HashFilter(hashsetfile = args.hashset,
+                                xmlfile = args.dfxml,
+                                matched = args.matched,
+                                unmatched = args.unmatched,
+                                bloom = False if args.no_bloom else None,
+                                stats = stats)
+    except (OSError, ValueError) as e:
+        print("Error: %s" % e)
+        sys.exit(1)
+    try:
+        hashfilter.process_dfxml()
+    finally:
+        stats.close()
@@ -24,6 +24,8 @@ a target forensic image (evidence file) using a DFXML report generated
 by the fiwalk program. Two outputs are produced:
 1) Directory of extracted hive files
 2) DFXML report of file system and file metadata for extracted hive files
+Other artifacts (e.g. Amcache.hve, event logs and prefetch files) can be
+extracted in the same pass using artifact classes and profiles.
 
 Copyright (c) 2015, Thomas Laurenson
 
@@ -44,19 +46,40 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 >>> CHANGELOG:
     0.1.0       Base functionality
+    0.2.0       Stream DFXML report entries as hives are extracted
+    0.3.0       Parse large DFXML reports in parallel (--jobs)
+    0.4.0       Read and write compressed DFXML reports
+    0.5.0       Throughput statistics and profiling (--stats, --profile)
+    0.6.0       Precompiled artifact matcher with configurable profiles
+    0.7.0       Stream extraction to disk with inline MD5, SHA-1 and SHA-256
+    0.8.0       Extract in image offset order using a pool of reader threads
+    0.9.0       Read images using imagereader (mmap and LRU block cache)
+    0.10.0      Run fiwalk as a pipeline, extracting while the image is walked
+    0.11.0      Content addressed, deduplicating output store (--store)
+    0.12.0      Batch mode for many images using a process pool (--batch)
 
 """
 
-__version__ = "0.1.0"
+__version__ = "0.12.0"
 
 import sys
 import os
-import io
+import time
 import shutil
-import hashlib
 import datetime
 import platform
-import xml.dom.minidom
+import io
+import csv
+import tempfile
+import threading
+import traceback
+import contextlib
+import multiprocessing
+import multiprocessing.connection
+import subprocess
+import collections
+import concurrent.futures
+import xml.etree.ElementTree as ET
 
 sys.path.append(r'../dfxml/python')
 try:
@@ -67,82 +90,564 @@ except ImportError:
     print('Now Exiting...')
     sys.exit(1)
 
+sys.path.append(r'../common')
+import dfxmlwriter
+import sharded
+import fileobjects
+import compressed
+import instrument
+import hashing
+import imagereader
+
+# Digests calculated while extracting, and verified against the DFXML report
+EXTRACT_DIGESTS = ("md5", "sha1", "sha256")
+
+# Size of each chunk read from the image and written to the output file
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+# Number of threads reading from the image, and extractions queued per thread
+IO_JOBS = 4
+IN_FLIGHT_PER_JOB = 4
+
+# Queued files are extracted when there are this many, or when the oldest
+# has waited this many seconds (so extraction overlaps a running fiwalk)
+EXTRACT_BATCH_SIZE = 1000
+EXTRACT_BATCH_SECONDS = 10
+
+# Seconds to wait for fiwalk to exit after its output could not be parsed
+FIWALK_EXIT_TIMEOUT = 5
+
+# Manifest of the content addressed store, and its columns
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["image", "filename", "artifact_class", "filesize",
+                   "md5", "sha1", "sha256", "hash_mismatch", "blob"]
+
+# Number of images processed at the same time in batch mode
+BATCH_JOBS = 4
+
+# Log of each image, and the combined DFXML report, in batch mode
+BATCH_LOG_NAME = "HiveExtractor.log"
+BATCH_REPORT_NAME = "batch.xml"
+
+# Namespace of the elements that record hash mismatches, and the source
+# image of each file in batch mode
+HIVEEXTRACTOR_PREFIX = "hiveextractor"
+HIVEEXTRACTOR_NAMESPACE = "https://github.com/thomaslaurenson/DFXMLTools/HiveExtractor"
+
+# List of known hive file names
+HIVE_NAMES = ['ntuser.dat',
+              'repair/sam',
+              'repair/security',
+              'repair/software',
+              'repair/system',
+              'system32/config/sam',
+              'system32/config/security',
+              'system32/config/software',
+              'system32/config/system',
+              'system32/config/components',
+              'local settings/application data/microsoft/windows/usrclass.dat']
+
+# Default artifact profile: (artifact class, path pattern) tuples
+DEFAULT_PROFILE = ([("hive", name) for name in HIVE_NAMES] +
+                   [("amcache", "amcache.hve"),
+                    ("eventlog", "*.evtx"),
+                    ("eventlog", "system32/config/*.evt"),
+                    ("prefetch", "windows/prefetch/*.pf"),
+                    ("setupapi", "windows/inf/setupapi.dev.log"),
+                    ("setupapi", "windows/setupapi.log"),
+                    ("jumplist", "recent/automaticdestinations/*"),
+                    ("jumplist", "recent/customdestinations/*"),
+                    ("srum", "system32/sru/srudb.dat")])
+
+# Artifact classes extracted when no profile or classes are given
+DEFAULT_CLASSES = ["hive"]
+
 ################################################################################
+class FiwalkError(Exception):
+    """ Raised when fiwalk cannot be run, fails, or writes invalid DFXML. """
+    pass
+
+class TeeReader(io.RawIOBase):
+    def __init__(self, f, copy):
+        """ Binary file wrapper that writes a copy of everything read from f
+            to the file object copy. """
+        self.f = f
+        self.copy = copy
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.copy.write(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+class BlobStore:
+    def __init__(self, path, algorithm="sha1"):
+        """ Content addressed store of extracted files. Each unique file is
+            written once to blobs/<xx>/<digest> (keyed by algorithm), and
+            each extracted file is recorded in the manifest (CSV), which is
+            appended to by every run that uses the store. """
+        if algorithm not in EXTRACT_DIGESTS:
+            raise ValueError("Unsupported store hash: %s" % algorithm)
+        self.path = path
+        self.algorithm = algorithm
+        self.tmpdir = os.path.join(path, "tmp")
+        os.makedirs(os.path.join(path, "blobs"), exist_ok=True)
+        os.makedirs(self.tmpdir, exist_ok=True)
+        manifest_fn = os.path.join(path, MANIFEST_NAME)
+        new_manifest = not os.path.exists(manifest_fn)
+        self.manifest = open(manifest_fn, 'a', encoding='utf-8', newline='')
+        self.lock = threading.Lock()
+        self.written = 0
+        self.deduplicated = 0
+        if new_manifest:
+            self._write_row(MANIFEST_FIELDS)
+
+    def blob_path(self, hexdigest):
+        """ Return the path of the blob for a hex digest. """
+        return os.path.join(self.path, "blobs", hexdigest[:2], hexdigest)
+
+    def has(self, hexdigest):
+        """ Return True if the store has a blob for a hex digest. """
+        return os.path.exists(self.blob_path(hexdigest))
+
+    def temp_file(self):
+        """ Return a new temporary file in the store, opened for writing. """
+        (fd, temp_path) = tempfile.mkstemp(dir=self.tmpdir)
+        os.close(fd)
+        return open(temp_path, 'wb')
+
+    def commit(self, temp_path, hexdigest):
+        """ Move a temporary file to the blob for its hex digest, or remove it
+            if the store already has the blob. The blob is created with a
+            hard link, which fails if it exists, so exactly one of several
+            threads or processes storing the same content writes it. """
+        blob = self.blob_path(hexdigest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(temp_path, blob)
+            written = True
+        except FileExistsError:
+            written = False
+        except OSError:
+            # Hard links are not supported, so only this process is safe
+            with self.lock:
+                written = not os.path.exists(blob)
+                if written:
+                    os.replace(temp_path, blob)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        with self.lock:
+            if written:
+                self.written += 1
+            else:
+                self.deduplicated += 1
+        return blob
+
+    def record(self, image, fi, artifact_class, hashes, hash_mismatch=None):
+        """ Add an extracted file to the manifest, with the hashes of its
+            blob. hash_mismatch is True if the hashes differ from the DFXML
+            report, or None (left empty) if the contents were not hashed. """
+        blob = os.path.relpath(self.blob_path(hashes[self.algorithm]), self.path)
+        if hash_mismatch is not None:
+            hash_mismatch = int(hash_mismatch)
+        self._write_row([os.path.abspath(image), fi.filename, artifact_class, fi.filesize,
+                         hashes.get("md5"), hashes.get("sha1"), hashes.get("sha256"),
+                         hash_mismatch, blob])
+
+    def _write_row(self, row):
+        """ Helper method to append a row to the manifest in one write, so
+            rows from concurrent runs are not interleaved. """
+        line = io.StringIO()
+        csv.writer(line).writerow(["" if value is None else value for value in row])
+        with self.lock:
+            self.manifest.write(line.getvalue())
+            self.manifest.flush()
+
+    def close(self):
+        self.manifest.close()
+
+def plan_runs(fi):
+    """ Return the byte runs of a fileobject in file order as (img_offset,
+        length, fill) tuples, with runs that are contiguous in the image
+        merged. Returns None if a run has no image offset or length. """
+    runs = list()
+    if fi.byte_runs is None:
+        return runs
+    for run in sorted(fi.byte_runs, key=lambda run: run.file_offset or 0):
+        if run.len is None:
+            return None
+        if run.fill is not None:
+            runs.append((None, run.len, run.fill))
+            continue
+        if run.img_offset is None:
+            return None
+        if runs and runs[-1][2] is None and runs[-1][0] + runs[-1][1] == run.img_offset:
+            runs[-1] = (runs[-1][0], runs[-1][1] + run.len, None)
+        else:
+            runs.append((run.img_offset, run.len, None))
+    return runs
+
+def first_offset(fi):
+    """ Return the lowest image offset of a fileobject, used to sort files
+        so that the image is read in order. """
+    offsets = [run.img_offset for run in (fi.byte_runs or list())
+               if run.fill is None and run.img_offset is not None]
+    return min(offsets) if offsets else float("inf")
+
+def read_profile(path):
+    """ Read an artifact profile. Each line is an artifact class and a path
+        pattern, separated by white space. Blank lines and lines starting
+        with # are ignored. """
+    profile = list()
+    with open(path, 'r', encoding='utf-8') as f:
+        for (number, line) in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(None, 1)
+            if len(fields) != 2:
+                raise ValueError("%s:%d: expected an artifact class and a path pattern" % (path, number))
+            profile.append((fields[0], fields[1].strip()))
+    return profile
+
+class ArtifactMatcher:
+    def __init__(self, profile=DEFAULT_PROFILE, classes=None, allocated=False):
+        """ Match artifacts based on file names from DFXML. The profile is a
+            list of (artifact class, pattern) tuples, where a pattern is the
+            trailing components of a path (e.g. system32/config/sam). The
+            last component can also be * or *.ext (e.g. *.evtx). Hive file
+            names are taken from: Windows Registry Forensics by Carvey (2011,
+            p.18), which is referenced in the regxml_extractor project.
+
+            Patterns are compiled once into a trie of reversed path
+            components, so matching takes one lookup per path component,
+            regardless of the number of patterns. """
+        self.allocated = allocated
+        # Each trie node is a list of [children, artifact class or None]
+        self.root = [dict(), None]
+        self.classes = list()
+        for (artifact_class, pattern) in profile:
+            if classes is not None and artifact_class not in classes:
+                continue
+            self._add(artifact_class, pattern)
+            if artifact_class not in self.classes:
+                self.classes.append(artifact_class)
+
+    def _add(self, artifact_class, pattern):
+        """ Helper method to add a pattern to the trie. """
+        parts = pattern.lower().replace("\\", "/").strip("/").split("/")
+        for (i, part) in enumerate(parts):
+            if not part or ("*" in part and i != len(parts) - 1):
+                raise ValueError("Invalid artifact pattern: %s" % pattern)
+        name = parts[-1]
+        if "*" in name and name != "*" and not (name.startswith("*.") and "*" not in name[2:]):
+            raise ValueError("Invalid artifact pattern (use * or *.ext): %s" % pattern)
+        node = self.root
+        for part in reversed(parts):
+            node = node[0].setdefault(part, [dict(), None])
+        node[1] = artifact_class
+
+    def match(self, filename):
+        """ Return the artifact class of a file name, or None. The most
+            specific (longest) matching pattern wins. """
+        parts = filename.lower().rstrip("/").split("/")
+        name = parts[-1]
+        keys = [name]
+        if "." in name:
+            keys.append("*." + name.rsplit(".", 1)[1])
+        keys.append("*")
+        children = self.root[0]
+        for key in keys:
+            node = children.get(key)
+            if node is None:
+                continue
+            artifact_class = node[1]
+            for part in reversed(parts[:-1]):
+                node = node[0].get(part)
+                if node is None:
+                    break
+                if node[1] is not None:
+                    artifact_class = node[1]
+            if artifact_class is not None:
+                return artifact_class
+        return None
+
+    def __call__(self, fi):
+        """ Return the artifact class of a FileObject, or None. """
+        if fi.filename is None:
+            return None
+        if self.allocated and not fi.is_allocated():
+            return None
+        return self.match(fi.filename)
+
 class HiveExtractor:
-    def __init__(self, imagefile=None, xmlfile=None, outputdir=None, allocated=False):
+    def __init__(self, imagefile=None, xmlfile=None, outputdir=None, allocated=False, jobs=1,
+                 compression=None, stats=None, profile=DEFAULT_PROFILE, classes=DEFAULT_CLASSES,
+                 io_jobs=IO_JOBS, cache_size=imagereader.CACHE_SIZE, store=None):
         self.imagefile = imagefile
         self.xmlfile = xmlfile
         self.outputdir = outputdir
         self.allocated = allocated
-        self.hives = list()
+        self.jobs = jobs
+        self.compression = compression
+        self.match = ArtifactMatcher(profile, classes, allocated)
+        self.report = None
+        self.report_fn = None
+        self.io_jobs = io_jobs
+        self.cache_size = cache_size
+        self.store = store
+        self.pending = list()
+        self.pending_since = None
+        self.image = None
+        self.output_names = set()
         self.target_fi_count = 0
+        self.stats = stats or instrument.Stats(os.path.basename(__file__))
 
     def process_target(self):
-        """ Process the target image. """
+        """ Process the target image. If processing fails the report is
+            aborted, not finished. """
+        self.open_report()
         print('\n>>> Processing target image for hive files ...')
-        for (event, obj) in Objects.iterparse(self.xmlfile):
-            if isinstance(obj, Objects.FileObject):
-                self.extract_hives(obj)
-        return
-
-    def extract_hives(self, fi):
-        """ Match hives based on file names from DFXML. Hive file names are
-            taken from: Windows Registry Forensics by Carvey (2011, p.18),
-            which is referenced in the regxml_extractor project. """
+        try:
+            if self.jobs > 1 and not sharded.is_shardable(self.xmlfile):
+                print("    Warning: Compressed DFXML reports cannot be processed in parallel")
+                self.jobs = 1
+            if self.jobs > 1:
+                self.process_target_sharded()
+            else:
+                with compressed.open_input(self.xmlfile) as f:
+                    source = instrument.CountingReader(f, self.stats)
+                    for fi in self.stats.iterate(fileobjects.iter_fileobjects(source), "parse"):
+                        self.extract_hives(fi)
+            self.extract_pending()
+        except BaseException:
+            self.report.abort()
+            raise
+        self.close_image()
+
+    def process_fiwalk(self, xmlfile):
+        """ Run fiwalk on the target image, and process its DFXML output as
+            it is produced, so files are extracted while the image is still
+            being walked. A copy of the DFXML output is written to xmlfile.
+            If processing fails the report is aborted, not finished. """
+        self.open_report()
+        print('\n>>> Processing fiwalk output for hive files ...')
+        try:
+            self.run_fiwalk(xmlfile)
+            self.extract_pending()
+        except BaseException:
+            self.report.abort()
+            raise
+        self.close_image()
+
+    def run_fiwalk(self, xmlfile):
+        """ Helper method to run fiwalk and queue the hive files in its
+            DFXML output. """
+        command = ["fiwalk", "-x", self.imagefile]
+        try:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise FiwalkError("Could not run fiwalk: %s" % e)
+        try:
+            with open(xmlfile, 'wb') as copy:
+                source = instrument.CountingReader(TeeReader(proc.stdout, copy), self.stats)
+                for fi in self.stats.iterate(fileobjects.iter_fileobjects(source), "parse"):
+                    self.extract_hives(fi, flush=True)
+        except ET.ParseError as e:
+            # Truncated output is usually fiwalk exiting early, so report
+            # its exit status rather than the parse error
+            try:
+                returncode = proc.wait(timeout=FIWALK_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                returncode = 0
+            if returncode != 0:
+                raise FiwalkError("fiwalk failed with exit status %d" % returncode)
+            raise FiwalkError("Invalid DFXML output from fiwalk (see %s): %s" % (xmlfile, e))
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+        returncode = proc.wait()
+        if returncode != 0:
+            raise FiwalkError("fiwalk failed with exit status %d" % returncode)
+
+    def process_target_sharded(self):
+        """ Match hives in shards of the DFXML report in parallel. """
+        worker = sharded.FileObjectWorker(self.match)
+        self.stats.count(bytes_parsed=os.path.getsize(self.xmlfile))
+        for (count, matches) in sharded.map_shards(self.xmlfile, worker, self.jobs, ordered=False):
+            self.target_fi_count += count
+            self.stats.count(files=count)
+            for fi in matches:
+                self.pending.append((fi, self.match(fi)))
+
+    def extract_hives(self, fi, flush=False):
+        """ Queue the file object for extraction if it is a hive file. If
+            flush is True (while fiwalk is running), the queue is extracted
+            in batches, otherwise it is extracted in one pass at the end, so
+            the whole queue is read in image offset order. """
         # If file name is None skip file object
         if fi.filename is None:
             return
-        fn = fi.filename.lower()
         self.target_fi_count += 1
-        if self.target_fi_count % 5000 == 0:
-            print("    Processed %d files from target DFXML file" % self.target_fi_count)
-        # List of known hive file names
-        hive_names = ['ntuser.dat',
-                      'repair/sam',
-                      'repair/security',
-                      'repair/software',
-                      'repair/system',
-                      'system32/config/sam',
-                      'system32/config/security',
-                      'system32/config/software',
-                      'system32/config/system',
-                      'system32/config/components',
-                      'local settings/application data/microsoft/windows/usrclass.dat']
-        # Find hive files using file name matching from fiwalk DFXML output
-        for hive_name in hive_names:
-            if fn.endswith(hive_name) and (self.allocated and fi.is_allocated()):
-                self.extract(fi)
-            elif not allocated and fn.endswith(hive_name):
-                self.extract(fi)
-
-    def extract(self, fi):
-        out_fn = fi.filename + '.hive'
-        out_fn = out_fn.replace('/','-').replace(' ','-')
-        out_fpath = os.path.join(self.outputdir, out_fn)
-        # Open output file and write file contents
-        with open(out_fpath, 'wb') as f:
-            contents = fi.byte_runs.iter_contents(self.imagefile)
-            contents = b"".join(contents)
-            f.write(contents)
-        f.close()
-        # Check the SHA-1 of fileobject VS extracted hive
-        if fi.sha1 is not None:
-            sha1 = self.sha1_file(out_fpath)
-            if sha1 != fi.sha1:
-                print("    Warning: SHA-1 hash mismatch for: %s" % os.path.basename(out_fpath))
-        # Add extracted hive file to 'hives' list
-        self.hives.append(fi)
-
-    def sha1_file(self, fi):
-        """ Helper method to calculate SHA-1 hash of extracted hive file. """
-        hasher = hashlib.sha1()
-        with open(fi, 'rb') as f:
-            buf = f.read()
-            hasher.update(buf)
-        return hasher.hexdigest()
+        self.stats.count(files=1)
+        # Find artifacts using file name matching from fiwalk DFXML output
+        with self.stats.phase("match"):
+            artifact_class = self.match(fi)
+        if artifact_class is not None:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.append((fi, artifact_class))
+        if flush and self.pending and (len(self.pending) >= EXTRACT_BATCH_SIZE or
+                             time.monotonic() - self.pending_since >= EXTRACT_BATCH_SECONDS):
+            self.extract_pending()
 
-    def dfxml_report(self):
-        """ Generate a DFXML report. """
+    def extract_pending(self):
+        """ Extract the queued file objects, sorted by image offset so the
+            image is read mostly sequentially. Files are read by a pool of
+            io_jobs threads, and added to the DFXML report in that order. """
+        if not self.pending:
+            return
+        self.pending.sort(key=lambda item: first_offset(item[0]))
+        print("    Extracting %d files ..." % len(self.pending))
+        if self.image is None:
+            # Opened once, so the block cache is shared by every batch
+            self.image = imagereader.open_image(self.imagefile, self.cache_size)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.io_jobs)) as pool:
+            in_flight = collections.deque()
+            for (fi, artifact_class) in self.pending:
+                out_fpath = self.output_path(fi, artifact_class)
+                in_flight.append(pool.submit(self.extract, fi, artifact_class, self.image, out_fpath))
+                if len(in_flight) >= max(1, self.io_jobs) * IN_FLIGHT_PER_JOB:
+                    self.add_to_report(*in_flight.popleft().result())
+            while in_flight:
+                self.add_to_report(*in_flight.popleft().result())
+        self.pending = list()
+        self.pending_since = None
+
+    def close_image(self):
+        """ Close the image, recording the block cache statistics. """
+        if self.image is None:
+            return
+        self.stats.count(cache_hits=self.image.hits, cache_misses=self.image.misses)
+        self.image.close()
+        self.image = None
+
+    def add_to_report(self, fi, mismatches=None):
+        """ Add an extracted file object to the DFXML report. Mismatches are
+            the hashes of the extracted contents that did not match the file
+            object, and are added to it as hash_mismatch elements. """
+        with self.stats.phase("serialize"):
+            if not mismatches:
+                self.report.append(fi)
+                return
+            element = fi.to_Element()
+            for (name, hexdigest) in sorted(mismatches.items()):
+                ET.SubElement(element, "%s:hash_mismatch" % HIVEEXTRACTOR_PREFIX,
+                              {"type" : name}).text = hexdigest
+            self.report.append(element)
+
+    def output_path(self, fi, artifact_class="hive"):
+        """ Return a unique output file path for a file object. Files with
+            the same path (e.g. an allocated and a deleted copy) are given a
+            numeric suffix, so they are not extracted to the same file. """
+        name = fi.filename.replace('/','-').replace(' ','-')
+        out_fn = name + '.' + artifact_class
+        suffix = 1
+        while out_fn in self.output_names:
+            suffix += 1
+            out_fn = "%s-%d.%s" % (name, suffix, artifact_class)
+        self.output_names.add(out_fn)
+        return os.path.join(self.outputdir, out_fn)
+
+    def extract(self, fi, artifact_class="hive", image=None, out_fpath=None):
+        """ Extract a file object, and return it with any hash mismatches
+            (see verify). The file is written to out_fpath (by default, see
+            output_path). If image is given (see imagereader), the byte runs
+            are read from it. With a store, the file is only read and written
+            if its blob is not in the store. The blob is found using the hash
+            in the DFXML report, so the contents of a deduplicated file are
+            not verified (its manifest row has an empty hash_mismatch). """
+        if out_fpath is None:
+            out_fpath = self.output_path(fi, artifact_class)
+        if self.store is not None:
+            expected = getattr(fi, self.store.algorithm, None)
+            if expected and self.store.has(expected.strip().lower()):
+                # Already in the store, skip reading the image
+                with self.store.lock:
+                    self.store.deduplicated += 1
+                self.stats.count(artifacts=1, deduplicated=1)
+                hashes = dict()
+                for name in EXTRACT_DIGESTS:
+                    if getattr(fi, name, None):
+                        hashes[name] = getattr(fi, name).strip().lower()
+                self.store.record(self.imagefile, fi, artifact_class, hashes)
+                return (fi, None)
+            f = self.store.temp_file()
+        else:
+            f = open(out_fpath, 'wb')
+        # Stream the file contents to the output file, hashing each chunk
+        hasher = hashing.MultiHasher(EXTRACT_DIGESTS)
+        hash_time = 0.0
+        start = time.perf_counter()
+        runs = plan_runs(fi) if image is not None else None
+        if runs is not None:
+            contents = image.read_runs(runs, EXTRACT_CHUNK_SIZE)
+        else:
+            contents = fi.byte_runs.iter_contents(self.imagefile, buffer_size=EXTRACT_CHUNK_SIZE)
+        try:
+            with f:
+                for chunk in contents:
+                    f.write(chunk)
+                    hash_start = time.perf_counter()
+                    hasher.update(chunk)
+                    hash_time += time.perf_counter() - hash_start
+        except BaseException:
+            if self.store is not None:
+                os.remove(f.name)
+            raise
+        self.stats.add_time("extract", time.perf_counter() - start - hash_time)
+        self.stats.add_time("hash", hash_time)
+        self.stats.count(artifacts=1, bytes_extracted=hasher.length, bytes_hashed=hasher.length)
+        hashes = hasher.hexdigests()
+        mismatches = self.verify(fi, hashes, out_fpath)
+        if self.store is not None:
+            self.store.commit(f.name, hashes[self.store.algorithm])
+            self.store.record(self.imagefile, fi, artifact_class, hashes, bool(mismatches))
+        return (fi, mismatches)
+
+    def verify(self, fi, hashes, out_fpath):
+        """ Helper method to check the hashes of an extracted file against the
+            fileobject. Returns a dictionary of the mismatched hashes of the
+            extracted contents. Hashes missing from the fileobject are only
+            added to it if no hash mismatched. """
+        mismatches = dict()
+        for name in EXTRACT_DIGESTS:
+            expected = getattr(fi, name, None)
+            if expected is not None and expected.strip().lower() != hashes[name]:
+                mismatches[name] = hashes[name]
+                print("    Warning: %s hash mismatch for: %s" %
+                      (name.upper(), os.path.basename(out_fpath)))
+        if not mismatches:
+            for name in EXTRACT_DIGESTS:
+                if getattr(fi, name, None) is None:
+                    setattr(fi, name, hashes[name])
+        return mismatches
+
+    def open_report(self):
+        """ Start a DFXML report, extracted hive files are appended to the
+            report as they are found. """
         dc = {"name" : os.path.basename(__file__),
               "type" : "Hash List",
               "date" : datetime.datetime.now().isoformat(),
@@ -154,16 +659,219 @@ class HiveExtractor:
               "os_arch" : platform.machine()}
         dfxml = Objects.DFXMLObject(command_line = " ".join(sys.argv),
                                     sources = [self.imagefile],
-                                    dc = dc,
-                                    files = self.hives)
-        # Write a temp DFXML file, format it, then write to logfile
-        temp_fi = io.StringIO(dfxml.to_dfxml())
-        xml_fi = xml.dom.minidom.parse(temp_fi)
-        report_fn = os.path.splitext(os.path.basename(self.imagefile))[0] + ".xml"
-        report_fn = os.path.join(self.outputdir, report_fn)
-        print("\n>>> DFXML Report: %s\n" % report_fn)
-        with open(report_fn, 'w') as f:
-            f.write(xml_fi.toprettyxml(indent="  "))
+                                    dc = dc)
+        dfxml.add_namespace(HIVEEXTRACTOR_PREFIX, HIVEEXTRACTOR_NAMESPACE)
+        self.report_fn = os.path.splitext(os.path.basename(self.imagefile))[0] + ".xml"
+        if self.compression:
+            self.report_fn += "." + self.compression
+        self.report_fn = os.path.join(self.outputdir, self.report_fn)
+        self.report = dfxmlwriter.DFXMLWriter(self.report_fn, dfxml)
+
+    def dfxml_report(self):
+        """ Finish the DFXML report. """
+        self.report.close()
+        print("\n>>> DFXML Report: %s\n" % self.report_fn)
+
+################################################################################
+def read_batch_manifest(path):
+    """ Read a batch manifest (CSV), one image and optional DFXML report per
+        line. Blank lines and lines starting with # are ignored, relative
+        paths are relative to the manifest. Returns (image, dfxml) tuples,
+        where dfxml is None if fiwalk should be run on the image. """
+    base = os.path.dirname(os.path.abspath(path))
+    tasks = list()
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for (lineno, row) in enumerate(csv.reader(f), 1):
+            row = [value.strip() for value in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if len(row) > 2:
+                raise ValueError("%s:%d: expected image and optional DFXML report" % (path, lineno))
+            imagefile = os.path.join(base, row[0])
+            xmlfile = None
+            if len(row) == 2 and row[1]:
+                xmlfile = os.path.join(base, row[1])
+            tasks.append((imagefile, xmlfile))
+    return tasks
+
+def batch_output_dirs(images, outputdir):
+    """ Return an output directory for each image, named after the image
+        (with a numeric suffix when image names are repeated). """
+    dirs = list()
+    seen = collections.Counter()
+    for imagefile in images:
+        name = os.path.splitext(os.path.basename(imagefile))[0]
+        seen[name] += 1
+        if seen[name] > 1:
+            name = "%s-%d" % (name, seen[name])
+        dirs.append(os.path.join(outputdir, name))
+    return dirs
+
+class BatchWorker:
+    def __init__(self, allocated=False, compression=None, profile=DEFAULT_PROFILE,
+                 classes=DEFAULT_CLASSES, io_jobs=IO_JOBS, cache_size=imagereader.CACHE_SIZE,
+                 store_path=None, store_hash="sha1", stats=False):
+        """ Process pool worker that extracts the artifacts of one image in
+            batch mode. Output (except the extracted files) is written to a
+            log in the image output directory, and any error is returned
+            rather than raised, so one image cannot stop the batch. If stats
+            is true, throughput statistics are recorded and returned for the
+            parent to report. """
+        self.allocated = allocated
+        self.compression = compression
+        self.profile = profile
+        self.classes = classes
+        self.io_jobs = io_jobs
+        self.cache_size = cache_size
+        self.store_path = store_path
+        self.store_hash = store_hash
+        self.stats = stats
+
+    def __call__(self, task):
+        (imagefile, xmlfile, outputdir) = task
+        result = {"image" : imagefile,
+                  "outputdir" : outputdir,
+                  "report" : None,
+                  "error" : None,
+                  "written" : 0,
+                  "deduplicated" : 0}
+        stats = instrument.Stats(os.path.basename(__file__), enabled=self.stats)
+        store = None
+        he = None
+        os.makedirs(outputdir, exist_ok=True)
+        with open(os.path.join(outputdir, BATCH_LOG_NAME), 'w', encoding='utf-8') as log:
+            with contextlib.redirect_stdout(log):
+                try:
+                    if self.store_path is not None:
+                        store = BlobStore(self.store_path, self.store_hash)
+                    he = HiveExtractor(imagefile = imagefile,
+                                       xmlfile = xmlfile,
+                                       outputdir = outputdir,
+                                       allocated = self.allocated,
+                                       compression = self.compression,
+                                       stats = stats,
+                                       profile = self.profile,
+                                       classes = self.classes,
+                                       io_jobs = self.io_jobs,
+                                       cache_size = self.cache_size,
+                                       store = store)
+                    if xmlfile is None:
+                        name = os.path.splitext(os.path.basename(imagefile))[0]
+                        he.process_fiwalk(os.path.join(outputdir, name + ".fiwalk.xml"))
+                    else:
+                        he.process_target()
+                    he.dfxml_report()
+                    result["report"] = he.report_fn
+                except Exception as e:
+                    traceback.print_exc(file=log)
+                    result["error"] = "%s: %s" % (type(e).__name__, e)
+                finally:
+                    if he is not None:
+                        he.close_image()
+                    if store is not None:
+                        result["written"] = store.written
+                        result["deduplicated"] = store.deduplicated
+                        store.close()
+        snapshot = stats.snapshot(final=True)
+        result["counters"] = snapshot["counters"]
+        result["phases"] = snapshot["phases"]
+        return result
+
+def _run_batch_task(worker, task, conn):
+    """ Helper method run in each batch process, which sends the result of
+        the worker back to the parent. """
+    conn.send(worker(task))
+    conn.close()
+
+def _failed_result(task, error):
+    """ Helper method to return the result of an image whose process died. """
+    (imagefile, xmlfile, outputdir) = task
+    return {"image" : imagefile,
+            "outputdir" : outputdir,
+            "report" : None,
+            "error" : error,
+            "written" : 0,
+            "deduplicated" : 0,
+            "counters" : dict(),
+            "phases" : dict()}
+
+def process_batch(tasks, worker, jobs):
+    """ Generator. Process (imagefile, xmlfile, outputdir) tasks using up to
+        jobs processes, yielding the result of each image in task order.
+        Each image has its own process, so no state is carried from one
+        image to the next, and a process that dies (e.g. killed when out of
+        memory) is reported as a failure of its image only. """
+    results = dict()
+    running = dict()
+    next_task = 0
+    next_result = 0
+    try:
+        while next_result < len(tasks):
+            while next_task < len(tasks) and len(running) < jobs:
+                (recv, send) = multiprocessing.Pipe(duplex=False)
+                proc = multiprocessing.Process(target=_run_batch_task,
+                                               args=(worker, tasks[next_task], send),
+                                               daemon=True)
+                proc.start()
+                send.close()
+                running[recv] = (next_task, proc)
+                next_task += 1
+            # A result is ready, or the pipe is closed because the process died
+            for recv in multiprocessing.connection.wait(list(running)):
+                (index, proc) = running.pop(recv)
+                try:
+                    results[index] = recv.recv()
+                except EOFError:
+                    proc.join()
+                    if proc.exitcode is not None and proc.exitcode < 0:
+                        error = "Worker process killed by signal %d" % -proc.exitcode
+                    else:
+                        error = "Worker process died (exit status %s)" % proc.exitcode
+                    results[index] = _failed_result(tasks[index], error)
+                recv.close()
+                proc.join()
+            while next_result in results:
+                yield results.pop(next_result)
+                next_result += 1
+    finally:
+        for (recv, (index, proc)) in running.items():
+            proc.terminate()
+            proc.join()
+            recv.close()
+
+def open_batch_report(report_fn, images):
+    """ Start the combined DFXML report of a batch, with every image as a
+        source. Files from each image are appended by add_image_report. """
+    dc = {"name" : os.path.basename(__file__),
+          "type" : "Hash List",
+          "date" : datetime.datetime.now().isoformat(),
+          "os_sysname" : platform.system(),
+          "os_release" : platform.release(),
+          "os_version" : platform.version(),
+          "os_host" : platform.node(),
+          "os_arch" : platform.machine()}
+    dfxml = Objects.DFXMLObject(command_line = " ".join(sys.argv),
+                                sources = list(images),
+                                dc = dc)
+    dfxml.add_namespace(HIVEEXTRACTOR_PREFIX, HIVEEXTRACTOR_NAMESPACE)
+    return dfxmlwriter.DFXMLWriter(report_fn, dfxml)
+
+def add_image_report(writer, imagefile, report_fn):
+    """ Append the files in the DFXML report of one image to the combined
+        report, each with an element naming its source image (and any
+        hash_mismatch elements). Returns the number of files added. """
+    count = 0
+    for elem in fileobjects.iter_fileobject_elements(report_fn):
+        fi = Objects.FileObject()
+        fi.populate_from_Element(elem)
+        element = fi.to_Element()
+        for mismatch in elem.iter("{%s}hash_mismatch" % HIVEEXTRACTOR_NAMESPACE):
+            ET.SubElement(element, "%s:hash_mismatch" % HIVEEXTRACTOR_PREFIX,
+                          mismatch.attrib).text = mismatch.text
+        ET.SubElement(element, "%s:image" % HIVEEXTRACTOR_PREFIX).text = imagefile
+        writer.append(element)
+        count += 1
+    return count
 
 ################################################################################
 if __name__=='__main__':
@@ -176,7 +884,8 @@ by the fiwalk program. Two outputs are produced:
 2) DFXML report of file system and file metadata for extracted hive files"""
 , formatter_class = argparse.RawTextHelpFormatter)
     parser.add_argument("imagefile",
-                        help = "Target disk image (e.g. target.E01)")
+                        help = "Target disk image (e.g. target.E01)",
+                        nargs = "?")
     parser.add_argument('outputdir',
                         help = 'Output directory')
     parser.add_argument("--dfxml",
@@ -191,8 +900,54 @@ by the fiwalk program. Two outputs are produced:
                         help = "Zap (delete) the output directory if it exists",
                         action = "store_true",
                         default = False)
+    parser.add_argument("-j", "--jobs",
+                        metavar = "N",
+                        help = "Number of processes used to parse the DFXML report (default: 1)",
+                        type = int,
+                        default = 1)
+    parser.add_argument("--artifacts",
+                        metavar = "PROFILE",
+                        help = "Artifact profile, one artifact class and path pattern per line\n(e.g. \"eventlog *.evtx\", default: built in profile)")
+    parser.add_argument("--classes",
+                        metavar = "CLASSES",
+                        help = "Comma separated artifact classes to extract, or all\n(default: hive, or all classes in --artifacts PROFILE)")
+    parser.add_argument("--io-jobs",
+                        metavar = "N",
+                        help = "Number of threads reading files from the image (default: %d)" % IO_JOBS,
+                        type = int,
+                        default = IO_JOBS)
+    parser.add_argument("--store",
+                        metavar = "DIR",
+                        help = "Write extracted files once to a content addressed store, with a\nmanifest of every extracted file (instead of OUTPUTDIR). Files already\nin the store are found by their DFXML hash and are not re-hashed")
+    parser.add_argument("--store-hash",
+                        help = "Hash used to address the store (default: sha1)",
+                        choices = ["sha1", "sha256"],
+                        default = "sha1")
+    parser.add_argument("--cache-size",
+                        metavar = "MB",
+                        help = "Size of the image block cache (default: %d)" % (imagereader.CACHE_SIZE // (1024 * 1024)),
+                        type = int,
+                        default = imagereader.CACHE_SIZE // (1024 * 1024))
+    parser.add_argument("--batch",
+                        metavar = "MANIFEST",
+                        help = "Process every image in MANIFEST (CSV, one image and optional DFXML\nreport per line) instead of imagefile, each in its own OUTPUTDIR subdirectory")
+    parser.add_argument("--batch-jobs",
+                        metavar = "N",
+                        help = "Number of images processed at the same time with --batch (default: %d)" % BATCH_JOBS,
+                        type = int,
+                        default = BATCH_JOBS)
+    parser.add_argument("--compress",
+                        help = "Compress the output DFXML report",
+                        choices = ["gz", "bz2", "xz"])
+    instrument.add_arguments(parser)
 
     args = parser.parse_args()
+    if (args.imagefile is None) == (args.batch is None):
+        parser.error("Specify either an imagefile or --batch MANIFEST")
+    if args.batch and args.dfxml:
+        parser.error("--dfxml cannot be used with --batch, add the reports to the manifest")
+    if args.batch_jobs < 1:
+        parser.error("--batch-jobs must be at least 1")
 
     imagefile = args.imagefile
     outputdir = args.outputdir
@@ -208,25 +963,123 @@ by the fiwalk program. Two outputs are produced:
     elif not os.path.exists(outputdir):
         os.makedirs(outputdir)
 
-    # Check for DFXML input, generate if not supplied
-    if xmlfile == None:
+    # Check for DFXML input, run fiwalk as a pipeline if not supplied
+    fiwalk_xmlfile = None
+    if xmlfile == None and not args.batch:
         print("\n>>> No fiwalk DFXML report provided")
-        print("    Running fiwalk now...")
+        print("    Running fiwalk now, files are extracted as they are found...")
         print("    This may take a long time depending on target disk size...")
-        xmlfile = os.path.splitext(imagefile)[0] + ".xml"
-        command = "fiwalk -X " + xmlfile + " " + imagefile
-        sysrc = os.system(command)
-        if sysrc:
-            print("\nAn error occured when running fiwalk.")
+        fiwalk_xmlfile = os.path.splitext(imagefile)[0] + ".xml"
+        if args.jobs > 1:
+            print("    Warning: fiwalk output cannot be processed in parallel")
+
+    profile = DEFAULT_PROFILE
+    classes = DEFAULT_CLASSES
+    if args.artifacts:
+        try:
+            profile = read_profile(args.artifacts)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        classes = None
+    if args.classes:
+        classes = [name.strip() for name in args.classes.split(",") if name.strip()]
+        if "all" in classes:
+            classes = None
+    try:
+        matcher = ArtifactMatcher(profile, classes)
+    except ValueError as e:
+        parser.error(str(e))
+    if not matcher.classes:
+        parser.error("No artifact patterns for classes: %s" % args.classes)
+
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
+    store = None
+    if args.store:
+        store = BlobStore(args.store, args.store_hash)
+
+    if args.batch:
+        try:
+            tasks = read_batch_manifest(args.batch)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if args.jobs > 1:
+            print("    Warning: DFXML reports are not processed in parallel with --batch")
+        # The store is created (with its manifest header) before the workers
+        # share it, and each worker opens its own
+        if store is not None:
+            store.close()
+        images = [imagefile for (imagefile, xmlfile) in tasks]
+        dirs = batch_output_dirs(images, outputdir)
+        worker = BatchWorker(allocated = allocated,
+                             compression = args.compress,
+                             profile = profile,
+                             classes = classes,
+                             io_jobs = args.io_jobs,
+                             cache_size = args.cache_size * 1024 * 1024,
+                             store_path = args.store,
+                             store_hash = args.store_hash,
+                             stats = stats.enabled)
+        report_fn = os.path.join(outputdir, BATCH_REPORT_NAME)
+        if args.compress:
+            report_fn += "." + args.compress
+        print("    -------------------------")
+        print(">>> EXTRACTING REGISTRY HIVES (%d images)" % len(tasks))
+        print("    -------------------------")
+        failures = 0
+        written = deduplicated = 0
+        with open_batch_report(report_fn, images) as report:
+            batch = [(imagefile, xmlfile, path) for ((imagefile, xmlfile), path) in zip(tasks, dirs)]
+            for (i, result) in enumerate(process_batch(batch, worker, args.batch_jobs), 1):
+                counters = dict(result["counters"])
+                stats.count(**counters)
+                for (name, seconds) in result["phases"].items():
+                    stats.add_time(name, seconds)
+                written += result["written"]
+                deduplicated += result["deduplicated"]
+                if result["error"] is not None:
+                    failures += 1
+                    print("    [%d/%d] FAILED %s: %s (see %s)" %
+                          (i, len(tasks), result["image"], result["error"],
+                           os.path.join(result["outputdir"], BATCH_LOG_NAME)))
+                    continue
+                count = add_image_report(report, result["image"], result["report"])
+                print("    [%d/%d] %s: %d files" % (i, len(tasks), result["image"], count))
+        print("\n>>> DFXML Report: %s" % report_fn)
+        print("    %d images processed, %d failed" % (len(tasks), failures))
+        if store is not None:
+            print("    Store: %d blobs written, %d duplicates skipped" % (written, deduplicated))
+        stats.close()
+        sys.exit(1 if failures else 0)
 
     # Generate REGXML
-    registry_fis = list()
     print("    -------------------------")
     print(">>> EXTRACTING REGISTRY HIVES")
     print("    -------------------------")
     he = HiveExtractor(imagefile = imagefile,
                        xmlfile = xmlfile,
                        outputdir = outputdir,
-                       allocated = allocated)
-    he.process_target()
-    he.dfxml_report()
+                       allocated = allocated,
+                       jobs = args.jobs,
+                       compression = args.compress,
+                       stats = stats,
+                       profile = profile,
+                       classes = classes,
+                       io_jobs = args.io_jobs,
+                       cache_size = args.cache_size * 1024 * 1024,
+                       store = store)
+    try:
+        if fiwalk_xmlfile is not None:
+            he.process_fiwalk(fiwalk_xmlfile)
+            print("    fiwalk DFXML report: %s" % fiwalk_xmlfile)
+        else:
+            he.process_target()
+        he.dfxml_report()
+    except FiwalkError as e:
+        print("\nError: %s" % e)
+        sys.exit(1)
+    finally:
+        if store is not None:
+            print("    Store: %d blobs written, %d duplicates skipped" %
+                  (store.written, store.deduplicated))
+            store.close()
+        stats.close()
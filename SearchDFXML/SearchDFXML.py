@@ -29,17 +29,29 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 >>> CHANGELOG:
     0.1.0       Base functionality
+    0.2.0       Write DFXML report using the streaming DFXML writer
+    0.3.0       Parse large DFXML reports in parallel (--jobs)
+    0.4.0       Read and write compressed DFXML reports
+    0.5.0       Persistent SQLite search index (--build-index, --index)
+    0.6.0       Search for a list of keywords in one pass (--keywords-file)
+    0.7.0       Filter on size, times, allocation, extension, regex and hashes
+    0.8.0       Stream matches to the DFXML report (or stdout), --max-matches
+    0.9.0       Throughput statistics and profiling (--stats, --profile)
 
 """
 
-__version__ = "0.1.0"
+__version__ = "0.9.0"
 
 import sys
 import os
+import re
+import zlib
+import time
+import collections
+import sqlite3
 import datetime
 import platform
-import io
-import xml.dom.minidom
+import xml.etree.ElementTree as ET
 
 sys.path.append(r'../dfxml/python')
 try:
@@ -50,32 +62,592 @@ except ImportError:
     print('Now Exiting...')
     sys.exit(1)
 
+sys.path.append(r'../common')
+import dfxmlwriter
+import sharded
+import fileobjects
+import compressed
+import instrument
+
+# Version of the search index schema, indexes with another version are rebuilt
+INDEX_VERSION = "2"
+
+# Number of fileobjects inserted into the search index at a time
+INDEX_BATCH_SIZE = 10000
+
+# Minimum number of seconds between updates of the live match count
+LIVE_COUNT_INTERVAL = 0.25
+
+# Namespace of the elements used to tag the keywords matched by each file
+SEARCHDFXML_PREFIX = "searchdfxml"
+SEARCHDFXML_NAMESPACE = "https://github.com/thomaslaurenson/DFXMLTools/SearchDFXML"
+
 ################################################################################
+class KeywordMatch:
+    def __init__(self, keyword):
+        """ Match fileobjects where the keyword is in the (lower case) file
+            name. """
+        self.keyword = keyword.lower()
+
+    def __call__(self, filename):
+        return self.keyword in filename.lower()
+
+class KeywordAutomaton:
+    def __init__(self, keywords):
+        """ Aho-Corasick automaton that finds all of the (lower case)
+            keywords in a file name in a single pass. Only lists and
+            dictionaries are used, so it can be pickled to shard workers. """
+        self.keywords = list()
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [list()]
+        # Keywords are de-duplicated in order, as watchlists can be large
+        for keyword in dict.fromkeys(keyword.lower() for keyword in keywords):
+            if keyword:
+                self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword):
+        """ Helper method to add a keyword to the trie. """
+        state = 0
+        for c in keyword:
+            next_state = self.goto[state].get(c)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][c] = next_state
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(list())
+            state = next_state
+        self.output[state].append(len(self.keywords))
+        self.keywords.append(keyword)
+
+    def _build_failure_links(self):
+        """ Helper method to set the failure link of each state (breadth
+            first), and merge the output of each state with its link. """
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for (c, next_state) in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(c, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """ Return the keywords found in text (which should be lower case),
+            in the order they were given. """
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set()
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if output[state]:
+                found.update(output[state])
+        return [self.keywords[i] for i in sorted(found)]
+
+def read_keywords(path):
+    """ Read a keywords file, one keyword per line. Blank lines and lines
+        starting with # are ignored. """
+    keywords = list()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                keywords.append(line)
+    return keywords
+
+class KeywordsMatch:
+    def __init__(self, automaton):
+        """ Match fileobjects where any keyword of the automaton is in the
+            (lower case) file name. """
+        self.automaton = automaton
+
+    def __call__(self, filename):
+        return bool(self.automaton.search(filename.lower()))
+
+class FileObjectFilter:
+    def __init__(self, name_match=None, min_size=None, max_size=None,
+                 modified_after=None, modified_before=None,
+                 created_after=None, created_before=None,
+                 allocated=None, extensions=None, regex=None, hashes=None):
+        """ Filter of fileobjects, evaluated on the fileobject Element so that
+            a FileObject is only built for matching files. Only the requested
+            checks are compiled, cheapest first, and only the fields they
+            need are read. """
+        self.checks = list()
+        self.fields = set()
+        if min_size is not None or max_size is not None:
+            self._add(self._check_size, ("filesize",), min_size, max_size)
+        if allocated is not None:
+            self._add(self._check_allocated, ("alloc", "alloc_inode", "alloc_name"), allocated)
+        if hashes:
+            self._add(self._check_hashes, hashes, tuple(hashes))
+        if extensions:
+            extensions = frozenset(ext.lower().lstrip(".") for ext in extensions)
+            self._add(self._check_extension, ("filename",), extensions)
+        if modified_after is not None or modified_before is not None:
+            self._add(self._check_time, ("mtime",), "mtime", modified_after, modified_before)
+        if created_after is not None or created_before is not None:
+            self._add(self._check_time, ("crtime",), "crtime", created_after, created_before)
+        if name_match is not None:
+            self._add(self._check_filename, ("filename",), name_match)
+        if regex is not None:
+            self._add(self._check_regex, ("filename",), re.compile(regex, re.IGNORECASE))
+
+    def _add(self, check, fields, *args):
+        """ Helper method to add a check and the fields it reads. """
+        self.checks.append((check, args))
+        self.fields.update(fields)
+
+    def __call__(self, elem):
+        fields = dict()
+        for child in elem:
+            tag = child.tag.rsplit("}", 1)[-1]
+            if tag == "hashdigest":
+                tag = child.get("type", "").lower()
+            if tag in self.fields:
+                fields[tag] = child.text
+        for (check, args) in self.checks:
+            if not check(fields, *args):
+                return False
+        return True
+
+    def _check_size(self, fields, min_size, max_size):
+        try:
+            filesize = int(fields.get("filesize"))
+        except (TypeError, ValueError):
+            return False
+        if min_size is not None and filesize < min_size:
+            return False
+        return max_size is None or filesize <= max_size
+
+    def _check_allocated(self, fields, allocated):
+        if fields.get("alloc") is not None:
+            is_allocated = (fields.get("alloc") or "").strip() == "1"
+        elif fields.get("alloc_inode") is not None or fields.get("alloc_name") is not None:
+            is_allocated = ((fields.get("alloc_inode") or "").strip() == "1" and
+                            (fields.get("alloc_name") or "").strip() == "1")
+        else:
+            return False
+        return is_allocated == allocated
+
+    def _check_hashes(self, fields, hashes):
+        return all(fields.get(name) for name in hashes)
+
+    def _check_extension(self, fields, extensions):
+        filename = fields.get("filename")
+        if filename is None:
+            return False
+        basename = filename.rsplit("/", 1)[-1]
+        if "." not in basename:
+            return False
+        return basename.rsplit(".", 1)[-1].lower() in extensions
+
+    def _check_time(self, fields, name, after, before):
+        value = fields.get(name)
+        if value is None:
+            return False
+        try:
+            value = parse_time(value.strip())
+        except ValueError:
+            return False
+        if after is not None and value < after:
+            return False
+        return before is None or value < before
+
+    def _check_filename(self, fields, name_match):
+        filename = fields.get("filename")
+        return filename is not None and name_match(filename)
+
+    def _check_regex(self, fields, regex):
+        filename = fields.get("filename")
+        return filename is not None and regex.search(filename) is not None
+
+def parse_time(value):
+    """ Parse an ISO 8601 timestamp (e.g. 2015-02-21 or 2015-02-21T10:00:00Z)
+        to a timezone aware datetime. Timestamps without a timezone are UTC. """
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
+
+class SearchIndex:
+    def __init__(self, path, xmlfile, stats=None):
+        """ SQLite search index of the fileobjects in a DFXML report. File
+            names are indexed using an FTS5 trigram index (if supported by
+            the SQLite library), and each fileobject is stored as compressed
+            XML so that search results can be written as DFXML. """
+        self.path = path
+        self.xmlfile = xmlfile
+        self.stats = stats or instrument.Stats(os.path.basename(__file__))
+        self.conn = sqlite3.connect(path)
+        self.fts = False
+
+    def source_stamp(self):
+        """ Return the (path, size, mtime) of the DFXML report, which is
+            compared to detect a stale index. """
+        st = os.stat(self.xmlfile)
+        return {"version" : INDEX_VERSION,
+                "source" : os.path.abspath(self.xmlfile),
+                "size" : str(st.st_size),
+                "mtime_ns" : str(st.st_mtime_ns)}
+
+    def is_current(self):
+        """ Return True if the index was built from the current report. """
+        try:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            return False
+        self.fts = meta.get("fts") == "1"
+        stamp = self.source_stamp()
+        return all(meta.get(key) == value for (key, value) in stamp.items())
+
+    def build(self):
+        """ Parse the DFXML report once and (re)build the index. """
+        self.conn.executescript("""
+            DROP TABLE IF EXISTS meta;
+            DROP TABLE IF EXISTS names;
+            DROP TABLE IF EXISTS files;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE files (id INTEGER PRIMARY KEY,
+                                filename TEXT,
+                                filename_lower TEXT,
+                                filesize INTEGER,
+                                alloc INTEGER,
+                                mtime REAL,
+                                atime REAL,
+                                ctime REAL,
+                                crtime REAL,
+                                md5 TEXT,
+                                sha1 TEXT,
+                                sha256 TEXT,
+                                xml BLOB);""")
+        try:
+            self.conn.execute("""CREATE VIRTUAL TABLE names USING fts5(
+                                 filename_lower, content='files', content_rowid='id',
+                                 tokenize='trigram')""")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite library without FTS5 or the trigram tokenizer
+            self.fts = False
+        count = 0
+        rows = list()
+        for elem in fileobjects.iter_fileobject_elements(self.xmlfile):
+            fi = Objects.FileObject()
+            fi.populate_from_Element(elem)
+            rows.append(self._row(fi, elem))
+            count += 1
+            if len(rows) >= INDEX_BATCH_SIZE:
+                self._insert(rows)
+                self.stats.count(files=len(rows))
+                rows = list()
+        self._insert(rows)
+        self.stats.count(files=len(rows))
+        if self.fts:
+            self.conn.execute("INSERT INTO names(names) VALUES ('rebuild')")
+        meta = self.source_stamp()
+        meta["fts"] = "1" if self.fts else "0"
+        self.conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        self.conn.commit()
+        return count
+
+    def _row(self, fi, elem):
+        """ Helper method to create the index row for a fileobject. """
+        filename = fi.filename
+        allocated = fi.is_allocated()
+        return (filename,
+                filename.lower() if filename is not None else None,
+                fi.filesize,
+                None if allocated is None else int(allocated),
+                _timestamp(fi.mtime),
+                _timestamp(fi.atime),
+                _timestamp(fi.ctime),
+                _timestamp(fi.crtime),
+                getattr(fi, "md5", None),
+                getattr(fi, "sha1", None),
+                getattr(fi, "sha256", None),
+                zlib.compress(ET.tostring(elem)))
+
+    def _insert(self, rows):
+        self.conn.executemany("""INSERT INTO files (filename, filename_lower, filesize, alloc,
+                                 mtime, atime, ctime, crtime, md5, sha1, sha256, xml)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+
+    def search(self, keyword, prefilter=None, where=("1", ())):
+        """ Generator. Yields a FileObject for each fileobject where keyword
+            is in the (lower case) file name, in document order. If keyword is
+            None, all fileobjects are searched. Only rows matching where, an
+            SQL condition on the files table and its parameters (see
+            index_conditions), are read. If prefilter is given, only
+            fileobjects where prefilter(elem) is true are yielded. """
+        (condition, params) = where
+        if keyword is not None:
+            keyword = keyword.lower()
+        if keyword is None:
+            rows = self.conn.execute("SELECT xml FROM files WHERE %s ORDER BY id" % condition,
+                                     params)
+        elif self.fts and len(keyword) >= 3:
+            # The trigram index is case insensitive, so also check with instr
+            query = '"%s"' % keyword.replace('"', '""')
+            rows = self.conn.execute("""SELECT files.xml FROM names
+                                        JOIN files ON files.id = names.rowid
+                                        WHERE names MATCH ? AND instr(files.filename_lower, ?) > 0
+                                        AND %s
+                                        ORDER BY files.id""" % condition,
+                                     (query, keyword) + tuple(params))
+        else:
+            rows = self.conn.execute("""SELECT xml FROM files
+                                        WHERE instr(filename_lower, ?) > 0 AND %s
+                                        ORDER BY id""" % condition,
+                                     (keyword,) + tuple(params))
+        for (data,) in rows:
+            fi = self._fileobject(data, prefilter)
+            if fi is not None:
+                yield fi
+
+    def search_keywords(self, automaton, prefilter=None, where=("1", ())):
+        """ Generator. Yields a FileObject for each fileobject where any
+            keyword of the automaton is in the (lower case) file name, in
+            document order. Only rows matching where are read (see search).
+            If prefilter is given, only fileobjects where prefilter(elem) is
+            true are yielded. """
+        (condition, params) = where
+        rows = self.conn.execute("SELECT id, filename_lower FROM files WHERE %s ORDER BY id" % condition,
+                                 params)
+        ids = [id for (id, filename) in rows
+               if filename is not None and automaton.search(filename)]
+        for id in ids:
+            (data,) = self.conn.execute("SELECT xml FROM files WHERE id = ?", (id,)).fetchone()
+            fi = self._fileobject(data, prefilter)
+            if fi is not None:
+                yield fi
+
+    def _fileobject(self, data, prefilter):
+        """ Helper method to build a FileObject from an index row, or return
+            None if it does not match the prefilter. """
+        elem = ET.fromstring(zlib.decompress(data))
+        if prefilter is not None and not prefilter(elem):
+            return None
+        fi = Objects.FileObject()
+        fi.populate_from_Element(elem)
+        return fi
+
+    def close(self):
+        self.conn.close()
+
+def _timestamp(value):
+    """ Helper method to convert a DFXML timestamp to seconds since the
+        epoch (or None), so time predicates can be evaluated in SQL. """
+    if value is None:
+        return None
+    try:
+        return parse_time(str(value).strip()).timestamp()
+    except ValueError:
+        return None
+
+# Hashes with a column in the search index
+INDEX_HASHES = ("md5", "sha1", "sha256")
+
+def index_conditions(predicates):
+    """ Translate the size, allocation, time and hash predicates into an SQL
+        condition on the files table of the search index. Returns the
+        (condition, params) tuple and the remaining predicates (extensions,
+        regex and hashes without a column), which are checked on the
+        fileobject Element. """
+    predicates = dict(predicates)
+    conditions = list()
+    params = list()
+    min_size = predicates.pop("min_size", None)
+    max_size = predicates.pop("max_size", None)
+    if min_size is not None or max_size is not None:
+        conditions.append("filesize IS NOT NULL")
+    if min_size is not None:
+        conditions.append("filesize >= ?")
+        params.append(min_size)
+    if max_size is not None:
+        conditions.append("filesize <= ?")
+        params.append(max_size)
+    allocated = predicates.pop("allocated", None)
+    if allocated is not None:
+        conditions.append("alloc = ?")
+        params.append(int(allocated))
+    for (column, after_key, before_key) in (("mtime", "modified_after", "modified_before"),
+                                            ("crtime", "created_after", "created_before")):
+        after = predicates.pop(after_key, None)
+        before = predicates.pop(before_key, None)
+        if after is not None or before is not None:
+            conditions.append("%s IS NOT NULL" % column)
+        if after is not None:
+            conditions.append("%s >= ?" % column)
+            params.append(after.timestamp())
+        if before is not None:
+            conditions.append("%s < ?" % column)
+            params.append(before.timestamp())
+    remaining = list()
+    for name in predicates.pop("hashes", None) or list():
+        if name in INDEX_HASHES:
+            conditions.append("COALESCE(%s, '') != ''" % name)
+        else:
+            remaining.append(name)
+    predicates["hashes"] = remaining
+    return ((" AND ".join(conditions) or "1", tuple(params)), predicates)
+
 class SearchDFXML:
-    def __init__(self, xmlfile=None, keyword=None, output=None):
+    def __init__(self, xmlfile=None, keyword=None, output=None, jobs=1, ordered=True,
+                 index=None, keywords=None, predicates=None, max_matches=None,
+                 live_count=False, stats=None):
         self.xmlfile = xmlfile
         self.keyword = keyword
+        self.automaton = None
+        name_match = None
+        if keywords is not None:
+            self.automaton = KeywordAutomaton(keywords)
+            name_match = KeywordsMatch(self.automaton)
+        elif keyword is not None:
+            name_match = KeywordMatch(keyword)
+        self.predicates = predicates or dict()
+        self.filter = FileObjectFilter(name_match, **self.predicates)
         self.output = output
-        self.matches = list()
+        self.jobs = jobs
+        self.ordered = ordered
+        self.index = index
+        self.max_matches = max_matches
+        self.live_count = live_count
+        # Progress goes to stderr if the report is written to stdout
+        self.log = sys.stderr if output in (None, "-") else sys.stdout
+        self.writer = None
+        self.match_count = 0
         self.target_fi_count = 0
+        self.last_count_update = 0
+        self.stats = stats or instrument.Stats(os.path.basename(__file__))
+
+    def open_index(self):
+        """ Open the search index, building it if it is missing or was built
+            from a different version of the target DFXML report. """
+        index = SearchIndex(self.index, self.xmlfile, self.stats)
+        if not index.is_current():
+            print('\n>>> Building search index: %s' % self.index, file=self.log)
+            count = index.build()
+            print("    Indexed %d files from target DFXML file" % count, file=self.log)
+        return index
 
     def process_dfxml(self):
-        """ Process the target DFXML report. """
-        print('\n>>> Processing target DFXML report ...')
-        for (event, obj) in Objects.iterparse(self.xmlfile):
-            if isinstance(obj, Objects.FileObject):
-                self.search_dfxml(obj)
+        """ Process the target DFXML report. Matches are written to the
+            DFXML report as they are found. """
+        if self.writer is None:
+            self.open_report()
+        if self.index:
+            self.process_index()
+            return
+        print('\n>>> Processing target DFXML report ...', file=self.log)
+        if self.jobs > 1 and not sharded.is_shardable(self.xmlfile):
+            print("    Warning: Compressed DFXML reports cannot be processed in parallel", file=self.log)
+            self.jobs = 1
+        if self.jobs > 1:
+            self.process_dfxml_sharded()
+            return
+        with compressed.open_input(self.xmlfile) as f:
+            source = instrument.CountingReader(f, self.stats)
+            elems = fileobjects.iter_fileobject_elements(source)
+            for elem in self.stats.iterate(elems, "parse"):
+                if not self.search_dfxml(elem):
+                    break
         return
-        
-    def search_dfxml(self, fi):
+
+    def process_index(self):
+        """ Search the target DFXML report using the search index. """
+        if self.jobs > 1:
+            print("    Warning: --jobs is not used when searching an index", file=self.log)
+        index = self.open_index()
+        print('\n>>> Searching index: %s' % self.index, file=self.log)
+        # Predicates with an index column are evaluated by SQLite, so only
+        # the remaining rows are decompressed and parsed
+        (where, remaining) = index_conditions(self.predicates)
+        prefilter = None
+        if any(value not in (None, []) for value in remaining.values()):
+            prefilter = FileObjectFilter(**remaining)
+        try:
+            if self.automaton is not None:
+                matches = index.search_keywords(self.automaton, prefilter, where)
+            else:
+                matches = index.search(self.keyword, prefilter, where)
+            for fi in matches:
+                if not self.report_match(fi):
+                    break
+        finally:
+            index.close()
+
+    def process_dfxml_sharded(self):
+        """ Process shards of the target DFXML report in parallel. Matches
+            are in document order, unless ordered is False. """
+        worker = sharded.FileObjectWorker(prefilter=self.filter)
+        results = sharded.map_shards(self.xmlfile, worker, self.jobs, self.ordered)
+        self.stats.count(bytes_parsed=os.path.getsize(self.xmlfile))
+        try:
+            for (count, matches) in results:
+                self.target_fi_count += count
+                self.stats.count(files=count)
+                if not all(self.report_match(fi) for fi in matches):
+                    break
+        finally:
+            # Stops the worker processes if the match limit was reached
+            results.close()
+
+    def search_dfxml(self, elem):
+        """ Search a fileobject Element. Returns False once the maximum
+            number of matches has been reported. """
         self.target_fi_count += 1
-        if self.target_fi_count % 5000 == 0:
-            print("    Processed %d files from target DFXML file" % self.target_fi_count)
-        if self.keyword in fi.filename.lower():
-            self.matches.append(fi)
-            
-    def dfxml_report(self):
-        """ Generate a DFXML report. """
+        self.stats.count(files=1)
+        # Only build a FileObject for fileobjects that match
+        with self.stats.phase("match"):
+            matched = self.filter(elem)
+        if matched:
+            with self.stats.phase("build"):
+                fi = Objects.FileObject()
+                fi.populate_from_Element(elem)
+            return self.report_match(fi)
+        return True
+
+    def report_match(self, fi):
+        """ Write a matching FileObject to the DFXML report. Returns False
+            once the maximum number of matches has been reported. """
+        with self.stats.phase("serialize"):
+            if self.automaton is not None:
+                self.writer.append(self.tag_keywords(fi))
+            else:
+                self.writer.append(fi)
+        self.match_count += 1
+        self.stats.count(matches=1)
+        if self.live_count:
+            now = time.monotonic()
+            if now - self.last_count_update >= LIVE_COUNT_INTERVAL:
+                self.last_count_update = now
+                sys.stderr.write("\r    Matches: %d" % self.match_count)
+                sys.stderr.flush()
+        if self.max_matches is not None and self.match_count >= self.max_matches:
+            print("\n    Stopping after %d matches" % self.match_count, file=self.log)
+            return False
+        return True
+
+    def tag_keywords(self, fi):
+        """ Return the Element of a matching FileObject, with a child element
+            for each keyword that was found in the file name. """
+        element = fi.to_Element()
+        for keyword in self.automaton.search(fi.filename.lower()):
+            ET.SubElement(element, "%s:keyword" % SEARCHDFXML_PREFIX).text = keyword
+        return element
+
+    def open_report(self):
+        """ Start the DFXML report, matches are appended by report_match. """
         dc = {"name" : os.path.basename(__file__),
               "type" : "Hash List",
               "date" : datetime.datetime.now().isoformat(),
@@ -87,15 +659,27 @@ class SearchDFXML:
               "os_arch" : platform.machine()}
         dfxml = Objects.DFXMLObject(command_line = " ".join(sys.argv),
                                     sources = [self.xmlfile],
-                                    dc = dc,
-                                    files = self.matches)                      
-        # Write a temp DFXML file, format it, then print to stdout
-        temp_fi = io.StringIO(dfxml.to_dfxml())
-        xml_fi = xml.dom.minidom.parse(temp_fi)
-        with open(self.output, 'w') as f:
-            f.write(xml_fi.toprettyxml(indent="  "))
-        print('\n>>> DFXML report: %s\n' % self.output)
+                                    dc = dc)
+        if self.automaton is not None:
+            dfxml.add_namespace(SEARCHDFXML_PREFIX, SEARCHDFXML_NAMESPACE)
+        self.writer = dfxmlwriter.DFXMLWriter(self.output, dfxml)
+
+    def dfxml_report(self):
+        """ Finish the DFXML report. """
+        if self.writer is None:
+            self.open_report()
+        self.writer.close()
+        if self.live_count:
+            sys.stderr.write("\r    Matches: %d\n" % self.match_count)
+        print('\n>>> DFXML report: %s (%d matches)\n' % (self.output, self.match_count), file=self.log)
         
+def _split_list(values):
+    """ Helper method to split repeated, comma separated option values. """
+    items = list()
+    for value in values or list():
+        items.extend(item.strip() for item in value.split(",") if item.strip())
+    return items
+
 ################################################################################
 if __name__=='__main__':
     import argparse
@@ -105,15 +689,145 @@ searches a fileobjects filename (full path).""")
     parser.add_argument("dfxml",
                         help = "Target DFXML report (e.g. target.xml)")
     parser.add_argument("output",
-                        help = "Output DFXML report (e.g. results.xml)")                        
+                        help = "Output DFXML report (e.g. results.xml), or - for stdout",
+                        nargs = "?")
+    parser.add_argument("--keyword",
+                        metavar = "KEYWORD",
+                        help = "Search for KEYWORD in file names instead of prompting for a keyword (can be combined with the other search criteria)")
+    parser.add_argument("-k", "--keywords-file",
+                        metavar = "FILE",
+                        help = "Search for each keyword in FILE (one per line) instead of prompting for a keyword")
+    parser.add_argument("--min-size",
+                        metavar = "BYTES",
+                        help = "Only match files of at least BYTES",
+                        type = int)
+    parser.add_argument("--max-size",
+                        metavar = "BYTES",
+                        help = "Only match files of at most BYTES",
+                        type = int)
+    parser.add_argument("--modified-after",
+                        metavar = "TIME",
+                        help = "Only match files modified at or after TIME (ISO 8601, UTC if no timezone)",
+                        type = parse_time)
+    parser.add_argument("--modified-before",
+                        metavar = "TIME",
+                        help = "Only match files modified before TIME",
+                        type = parse_time)
+    parser.add_argument("--created-after",
+                        metavar = "TIME",
+                        help = "Only match files created at or after TIME",
+                        type = parse_time)
+    parser.add_argument("--created-before",
+                        metavar = "TIME",
+                        help = "Only match files created before TIME",
+                        type = parse_time)
+    allocation = parser.add_mutually_exclusive_group()
+    allocation.add_argument("--allocated",
+                            help = "Only match allocated files",
+                            dest = "allocated",
+                            action = "store_const",
+                            const = True)
+    allocation.add_argument("--unallocated",
+                            help = "Only match unallocated (deleted) files",
+                            dest = "allocated",
+                            action = "store_const",
+                            const = False)
+    parser.add_argument("--ext",
+                        metavar = "EXT",
+                        help = "Only match files with these extensions (e.g. exe,dll)",
+                        action = "append")
+    parser.add_argument("--regex",
+                        metavar = "PATTERN",
+                        help = "Only match files where the file name matches PATTERN (case insensitive)")
+    parser.add_argument("--has-hash",
+                        metavar = "HASH",
+                        help = "Only match files with these hashes (e.g. md5,sha1)",
+                        action = "append")
+    parser.add_argument("--max-matches",
+                        metavar = "N",
+                        help = "Stop searching after N matches",
+                        type = int)
+    parser.add_argument("--live-count",
+                        help = "Show a running count of matches (on stderr)",
+                        action = "store_true")
+    parser.add_argument("--build-index",
+                        metavar = "INDEX",
+                        help = "Build (or rebuild if stale) a search index for the DFXML report, then exit")
+    parser.add_argument("--index",
+                        metavar = "INDEX",
+                        help = "Search using an index, which is built if missing or stale")
+    parser.add_argument("-j", "--jobs",
+                        metavar = "N",
+                        help = "Number of processes used to parse the DFXML report (default: 1)",
+                        type = int,
+                        default = 1)
+    parser.add_argument("--unordered",
+                        help = "With --jobs, report matches as each shard finishes instead of in document order",
+                        action = "store_true")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
     xmlfile = args.dfxml
     output = args.output
-    keyword = input("\n>>> Enter search keyword: ")
+    stats = instrument.Stats.from_args(os.path.basename(__file__), args)
+    if args.build_index:
+        search = SearchDFXML(xmlfile = xmlfile,
+                             index = args.build_index,
+                             stats = stats)
+        with stats.phase("index"):
+            search.open_index().close()
+        stats.close()
+        sys.exit(0)
+    if output is None:
+        parser.error("the following arguments are required: output")
+    predicates = {"min_size" : args.min_size,
+                  "max_size" : args.max_size,
+                  "modified_after" : args.modified_after,
+                  "modified_before" : args.modified_before,
+                  "created_after" : args.created_after,
+                  "created_before" : args.created_before,
+                  "allocated" : args.allocated,
+                  "extensions" : _split_list(args.ext),
+                  "regex" : args.regex,
+                  "hashes" : [name.lower() for name in _split_list(args.has_hash)]}
+    if args.regex is not None:
+        try:
+            re.compile(args.regex)
+        except re.error as e:
+            parser.error("invalid --regex: %s" % e)
+    if args.keyword is not None and args.keywords_file:
+        parser.error("--keyword cannot be used with --keywords-file")
+    if args.keyword is not None and not args.keyword:
+        parser.error("--keyword cannot be empty")
+    keyword = args.keyword
+    keywords = None
+    if args.keywords_file:
+        keywords = read_keywords(args.keywords_file)
+        if not keywords:
+            parser.error("no keywords in keywords file: %s" % args.keywords_file)
+    elif keyword is None and not any(value not in (None, []) for value in predicates.values()):
+        # Without any other search criteria, prompt for a keyword
+        if output == "-":
+            # Keep the prompt out of the DFXML report written to stdout
+            sys.stderr.write("\n>>> Enter search keyword: ")
+            sys.stderr.flush()
+            keyword = input()
+        else:
+            keyword = input("\n>>> Enter search keyword: ")
     
     search = SearchDFXML(xmlfile = xmlfile,
                          keyword = keyword,
-                         output = output)
-    search.process_dfxml()
-    search.dfxml_report()
+                         keywords = keywords,
+                         output = output,
+                         jobs = args.jobs,
+                         ordered = not args.unordered,
+                         index = args.index,
+                         predicates = predicates,
+                         max_matches = args.max_matches,
+                         live_count = args.live_count,
+                         stats = stats)
+    try:
+        search.process_dfxml()
+        search.dfxml_report()
+    finally:
+        stats.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+compressed.py is a helper module to transparently read and write gzip,
+bzip2 and xz compressed reports. Compressed input is detected using the
+magic bytes at the start of the file, and compressed output is selected
+using the file name extension (.gz, .bz2 or .xz).
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+
+"""
+
+__version__ = "0.1.0"
+
+import bz2
+import gzip
+import lzma
+
+# Magic bytes at the start of each compressed file format
+MAGIC = [(b"\x1f\x8b", "gz"),
+         (b"BZh", "bz2"),
+         (b"\xfd7zXZ\x00", "xz")]
+
+# Module used to open each compressed file format
+OPENERS = {"gz" : gzip,
+           "bz2" : bz2,
+           "xz" : lzma}
+
+################################################################################
+def detect_compression(path):
+    """ Return the compression format of a file (gz, bz2 or xz) using its
+        magic bytes, or None if the file is not compressed. """
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for (magic, compression) in MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+def compression_from_name(path):
+    """ Return the compression format for a file name extension, or None. """
+    for compression in OPENERS:
+        if path.lower().endswith("." + compression):
+            return compression
+    return None
+
+def open_input(path):
+    """ Open a (possibly compressed) file for reading in binary mode. """
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    return OPENERS[compression].open(path, 'rb')
+
+def open_output(path, compression=None, buffering=-1):
+    """ Open a file for writing text (UTF-8). If compression is None, it is
+        selected from the file name extension. """
+    if compression is None:
+        compression = compression_from_name(path)
+    if compression is None:
+        return open(path, 'w', encoding='utf-8', buffering=buffering, newline='')
+    if compression == "gz":
+        # The default gzip level (9) is much slower for little gain
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    return OPENERS[compression].open(path, 'wt', encoding='utf-8', newline='')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+dfxmlwriter.py is a helper module that writes a DFXML report incrementally.
+The document header is written first, then each fileobject as it is
+produced, then the document footer. Only one fileobject is held in memory
+at a time, instead of building (and pretty printing) the whole report.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Write compressed reports (.gz, .bz2 or .xz)
+    0.3.0       Write RegXML reports (RegXMLWriter)
+
+"""
+
+__version__ = "0.3.0"
+
+import sys
+import xml.etree.ElementTree as ET
+
+import compressed
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Placeholder element used to split the document into a header and footer
+SPLIT_TAG = "__dfxmlwriter_split__"
+
+################################################################################
+def split_document(root, indent="  ", parent=None):
+    """ Serialise an (empty) document element and split it into the text
+        before and after the point where child objects are appended, which
+        is the end of parent (default: the document element). """
+    if parent is None:
+        parent = root
+    parent.append(ET.Element(SPLIT_TAG))
+    if indent:
+        ET.indent(root, space=indent)
+    text = ET.tostring(root, encoding="unicode")
+    (header, footer) = text.split("<%s />" % SPLIT_TAG)
+    if indent:
+        header = header.rstrip() + "\n"
+        footer = footer.lstrip("\n")
+    return (header, footer + "\n")
+
+class XMLStreamWriter:
+    def __init__(self, output, header, footer, depth=1, indent="  "):
+        """ Write the header to output, which is a file name, a file like
+            object, or None or "-" for standard output (stdout). File names
+            ending in .gz, .bz2 or .xz are compressed. """
+        self.indent = indent
+        self.depth = depth
+        self.footer = footer
+        self.count = 0
+        self.close_output = False
+        if output is None or output == "-":
+            self.output = sys.stdout
+        elif isinstance(output, str):
+            self.output = compressed.open_output(output)
+            self.close_output = True
+        else:
+            self.output = output
+        self.output.write(XML_DECLARATION)
+        self.output.write(header)
+
+    def append(self, obj):
+        """ Write an object (anything with a to_Element method, or an
+            Element) to the output. """
+        if isinstance(obj, ET.Element):
+            element = obj
+        else:
+            element = obj.to_Element()
+        if self.indent:
+            ET.indent(element, space=self.indent, level=self.depth)
+            self.output.write(self.indent * self.depth)
+            self.output.write(ET.tostring(element, encoding="unicode"))
+            self.output.write("\n")
+        else:
+            self.output.write(ET.tostring(element, encoding="unicode"))
+        self.count += 1
+
+    def close(self):
+        """ Write the footer and close the output, if it was opened here. """
+        if self.footer is None:
+            return
+        self.output.write(self.footer)
+        self.footer = None
+        if self.close_output:
+            self.output.close()
+        else:
+            self.output.flush()
+
+    def abort(self):
+        """ Close the output (if it was opened here) without writing the
+            footer, so an incomplete document is not well formed. """
+        if self.footer is None:
+            return
+        self.footer = None
+        if self.close_output:
+            self.output.close()
+        else:
+            self.output.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+class DFXMLWriter(XMLStreamWriter):
+    def __init__(self, output, dfxml, indent="  "):
+        """ Write a DFXML report for the (empty) DFXMLObject to output.
+            FileObjects are written to the report using append. """
+        (header, footer) = split_document(dfxml.to_Element(), indent=indent)
+        XMLStreamWriter.__init__(self, output, header, footer, depth=1, indent=indent)
+
+class RegXMLWriter(XMLStreamWriter):
+    def __init__(self, output, regxml, indent="  "):
+        """ Write a RegXML report for the RegXMLObject to output, where the
+            last hive of regxml is empty. CellObjects are written to that
+            hive using append. """
+        root = regxml.to_Element()
+        (header, footer) = split_document(root, indent=indent, parent=root[-1])
+        XMLStreamWriter.__init__(self, output, header, footer, depth=2, indent=indent)
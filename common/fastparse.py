@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+fastparse.py is a helper module that streams selected fields of each
+fileobject from a DFXML report. It uses the expat parser directly, so no
+element tree or Objects.FileObject is built, and only the text of the
+requested fields is kept. Memory use is flat regardless of report size.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Read compressed DFXML reports
+
+"""
+
+__version__ = "0.2.0"
+
+import xml.parsers.expat
+
+import compressed
+
+# Field names that are read from <hashdigest type="..."> elements
+HASH_FIELDS = ("md5", "sha1", "sha224", "sha256", "sha384", "sha512")
+
+# Size of each read from the DFXML report
+BUFFER_SIZE = 1024 * 1024
+
+################################################################################
+class FieldExtractor:
+    def __init__(self, fields, callback):
+        """ Call callback with a dictionary of the requested fields for each
+            fileobject. Fields are the names of elements directly below a
+            fileobject (e.g. filename, filesize, mtime) or hash names (e.g.
+            sha1). Missing fields are set to None. """
+        self.fields = tuple(fields)
+        self.wanted = frozenset(self.fields)
+        self.callback = callback
+        self.record = None
+        self.depth = 0
+        self.field = None
+        self.cdata = list()
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self._start_element
+        self.parser.EndElementHandler = self._end_element
+        self.parser.CharacterDataHandler = self._char_data
+
+    def _start_element(self, name, attrs):
+        if self.record is None:
+            if _local_name(name) == "fileobject":
+                self.record = dict.fromkeys(self.fields)
+                self.depth = 1
+            return
+        self.depth += 1
+        # Only direct children of the fileobject are of interest
+        if self.depth != 2:
+            return
+        local = _local_name(name)
+        if local == "hashdigest":
+            local = attrs.get("type", "").lower()
+        if local in self.wanted:
+            self.field = local
+            self.cdata = list()
+
+    def _end_element(self, name):
+        if self.record is None:
+            return
+        self.depth -= 1
+        if self.depth == 1 and self.field is not None:
+            value = "".join(self.cdata)
+            if self.field != "filename":
+                value = value.strip()
+            self.record[self.field] = value
+            self.field = None
+        elif self.depth == 0:
+            record = self.record
+            self.record = None
+            self.callback(record)
+
+    def _char_data(self, data):
+        if self.field is not None:
+            self.cdata.append(data)
+
+    def feed(self, data, final=False):
+        """ Parse the next block of the DFXML report. """
+        self.parser.Parse(data, final)
+
+def _local_name(name):
+    """ Helper method to remove a namespace prefix from an element name. """
+    return name.rsplit(":", 1)[-1]
+
+def iter_fields(xmlfile, fields, buffer_size=BUFFER_SIZE):
+    """ Generator. Yields a dictionary of the requested fields for each
+        fileobject in a DFXML report (a file name or binary file object).
+        Compressed reports are decompressed transparently. """
+    if isinstance(xmlfile, str):
+        with compressed.open_input(xmlfile) as f:
+            for record in iter_fields(f, fields, buffer_size):
+                yield record
+        return
+    records = list()
+    extractor = FieldExtractor(fields, records.append)
+    while True:
+        data = xmlfile.read(buffer_size)
+        extractor.feed(data, final=not data)
+        for record in records:
+            yield record
+        del records[:]
+        if not data:
+            break
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+fileobjects.py is a helper module that streams Objects.FileObject objects
+from a DFXML report. Unlike Objects.iterparse, the report can be a file
+object (such as a decompressed or piped stream), and compressed reports
+are decompressed transparently.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+
+"""
+
+__version__ = "0.1.0"
+
+import xml.etree.ElementTree as ET
+
+# The DFXML Objects module has been added to sys.path by the tool
+import Objects
+
+import compressed
+
+################################################################################
+def iter_fileobject_elements(xmlfile):
+    """ Generator. Yields the Element of each fileobject in a DFXML report
+        (a file name or binary file object). Each Element is cleared and
+        removed from the tree when the next one is requested. """
+    if isinstance(xmlfile, str):
+        with compressed.open_input(xmlfile) as f:
+            for elem in iter_fileobject_elements(f):
+                yield elem
+        return
+    parents = list()
+    for (event, elem) in ET.iterparse(xmlfile, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag.rsplit("}", 1)[-1] != "fileobject":
+            continue
+        yield elem
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+def iter_fileobjects(xmlfile):
+    """ Generator. Yields an Objects.FileObject for each fileobject in a
+        DFXML report (a file name or binary file object). """
+    for elem in iter_fileobject_elements(xmlfile):
+        fi = Objects.FileObject()
+        fi.populate_from_Element(elem)
+        yield fi
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+hashing.py is a helper module that calculates multiple message digests of a
+data file in a single pass. The file is read once, in fixed size chunks (or
+using mmap for large files), and each chunk is fed to every requested hash
+algorithm, so memory use is bounded by the chunk size.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Piecewise (block level) hashing
+
+"""
+
+__version__ = "0.2.0"
+
+import os
+import mmap
+import hashlib
+
+# Supported digest names, in the order they are reported
+SUPPORTED_DIGESTS = ("md5", "sha1", "sha256")
+DEFAULT_DIGESTS = ("sha1", "md5")
+
+# Read size for each chunk, and the file size where mmap is used instead
+CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+################################################################################
+class MultiHasher:
+    def __init__(self, digests=DEFAULT_DIGESTS):
+        for name in digests:
+            if name not in SUPPORTED_DIGESTS:
+                raise ValueError("Unsupported digest: %s" % name)
+        self.digests = tuple(digests)
+        self.hashers = [hashlib.new(name) for name in self.digests]
+        self.length = 0
+
+    def update(self, buf):
+        """ Feed a chunk of data to every hash algorithm. """
+        for hasher in self.hashers:
+            hasher.update(buf)
+        self.length += len(buf)
+
+    def hexdigests(self):
+        """ Return a dictionary of digest name to hex digest. """
+        return dict((name, hasher.hexdigest())
+                    for (name, hasher) in zip(self.digests, self.hashers))
+
+def parse_digests(value):
+    """ Helper method to parse a comma separated list of digest names. """
+    digests = [name.strip().lower() for name in value.split(",") if name.strip()]
+    for name in digests:
+        if name not in SUPPORTED_DIGESTS:
+            raise ValueError("Unsupported digest: %s (choose from %s)" %
+                             (name, ", ".join(SUPPORTED_DIGESTS)))
+    return tuple(digests)
+
+def iter_chunks(fi, chunk_size=CHUNK_SIZE, use_mmap=True):
+    """ Generator. Yields the contents of a data file as memoryview chunks.
+        Each chunk is only valid until the next chunk is requested. """
+    with open(fi, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                with memoryview(m) as view:
+                    for offset in range(0, size, chunk_size):
+                        with view[offset:offset + chunk_size] as chunk:
+                            yield chunk
+            return
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            count = f.readinto(buf)
+            if not count:
+                break
+            yield view[:count]
+
+def hash_file(fi, digests=DEFAULT_DIGESTS, chunk_size=CHUNK_SIZE):
+    """ Calculate all requested digests of a data file in one read pass.
+        Returns a dictionary of digest name to hex digest. """
+    hasher = MultiHasher(digests)
+    for chunk in iter_chunks(fi, chunk_size):
+        hasher.update(chunk)
+    return hasher.hexdigests()
+
+def hash_file_piecewise(fi, piece_size, digests=DEFAULT_DIGESTS, chunk_size=CHUNK_SIZE):
+    """ Calculate all requested digests of a data file, and of each fixed
+        size piece of the file, in one read pass. Returns a tuple of the
+        whole file digests and a list of (offset, length, digests) pieces. """
+    if piece_size <= 0:
+        raise ValueError("Piece size must be greater than zero")
+    hasher = MultiHasher(digests)
+    piece = MultiHasher(digests)
+    piece_offset = 0
+    pieces = list()
+    for chunk in iter_chunks(fi, chunk_size):
+        hasher.update(chunk)
+        # Split the chunk across piece boundaries
+        offset = 0
+        while offset < len(chunk):
+            count = min(piece_size - piece.length, len(chunk) - offset)
+            piece.update(chunk[offset:offset + count])
+            offset += count
+            if piece.length == piece_size:
+                pieces.append((piece_offset, piece.length, piece.hexdigests()))
+                piece_offset += piece.length
+                piece = MultiHasher(digests)
+    if piece.length:
+        pieces.append((piece_offset, piece.length, piece.hexdigests()))
+    return (hasher.hexdigests(), pieces)
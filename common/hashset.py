@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+hashset.py is a helper module that writes a sorted, deduplicated binary
+hash set. The file has a 32 byte header (magic, hash algorithm and record
+count) followed by fixed width raw digests in ascending order, so it can
+be searched directly with a binary search. Large hash sets are sorted in
+bounded memory by writing sorted runs to temporary files and merging them.
+Hash sets are searched using a memory mapped binary search, optionally with
+a Bloom filter in front to reject most absent digests without a search.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Memory mapped hash set lookups and Bloom filters
+    0.3.0       In memory Bloom filter (BloomFilter)
+
+"""
+
+__version__ = "0.3.0"
+
+import math
+import mmap
+import heapq
+import struct
+import tempfile
+
+MAGIC = b"DFXMLHS1"
+
+# Header: magic, algorithm name (NUL padded), record count, reserved
+HEADER = struct.Struct("<8s8sQQ")
+
+# Digest length in bytes of each supported hash algorithm
+DIGEST_SIZES = {"md5" : 16, "sha1" : 20, "sha256" : 32}
+
+# Number of digests held in memory before a sorted run is written to disk
+RUN_SIZE = 1000000
+
+BLOOM_MAGIC = b"DFXMLBF1"
+
+# Bloom header: magic, number of bits, number of hashes, hash set count
+BLOOM_HEADER = struct.Struct("<8sQQQ")
+
+# Bloom filter size, 10 bits per digest gives about 1% false positives
+BLOOM_BITS_PER_DIGEST = 10
+
+################################################################################
+class SortedHashSetWriter:
+    def __init__(self, path, algorithm="sha1", run_size=RUN_SIZE):
+        """ Write a sorted binary hash set of hex digests added with add. """
+        if algorithm not in DIGEST_SIZES:
+            raise ValueError("Unsupported hash algorithm: %s" % algorithm)
+        self.path = path
+        self.algorithm = algorithm
+        self.width = DIGEST_SIZES[algorithm]
+        self.run_size = run_size
+        self.current = set()
+        self.runs = list()
+        self.count = 0
+        self.closed = False
+
+    def add(self, hexdigest):
+        """ Add a hex digest to the hash set. Invalid digests are ignored,
+            and True is returned if the digest was accepted. """
+        try:
+            digest = bytes.fromhex(hexdigest)
+        except (TypeError, ValueError):
+            return False
+        if len(digest) != self.width:
+            return False
+        self.current.add(digest)
+        if len(self.current) >= self.run_size:
+            self._write_run()
+        return True
+
+    def _write_run(self):
+        """ Write the sorted digests held in memory to a temporary file. """
+        run = tempfile.TemporaryFile()
+        run.write(b"".join(sorted(self.current)))
+        run.seek(0)
+        self.runs.append(run)
+        self.current = set()
+
+    def close(self):
+        """ Merge all sorted runs into the output file. Returns the number of
+            unique digests written. """
+        if self.closed:
+            return self.count
+        self.closed = True
+        if self.runs:
+            self._write_run()
+            digests = heapq.merge(*[_iter_records(run, self.width) for run in self.runs])
+        else:
+            digests = iter(sorted(self.current))
+        self.count = 0
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.algorithm.encode('ascii'), 0, 0))
+            previous = None
+            for digest in digests:
+                if digest != previous:
+                    f.write(digest)
+                    self.count += 1
+                    previous = digest
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, self.algorithm.encode('ascii'), self.count, 0))
+        for run in self.runs:
+            run.close()
+        self.runs = list()
+        self.current = set()
+        return self.count
+
+    def abort(self):
+        """ Discard the digests added, without writing the output file. """
+        self.closed = True
+        for run in self.runs:
+            run.close()
+        self.runs = list()
+        self.current = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def _iter_records(f, width, buffer_records=65536):
+    """ Generator. Yields fixed width records from a binary file. """
+    while True:
+        data = f.read(width * buffer_records)
+        if not data:
+            break
+        for offset in range(0, len(data), width):
+            yield data[offset:offset + width]
+
+def read_header(f):
+    """ Read a hash set header, returns a tuple of algorithm and count. """
+    data = f.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise ValueError("Not a binary hash set: file is too short")
+    (magic, algorithm, count, reserved) = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary hash set: bad magic")
+    algorithm = algorithm.rstrip(b"\0").decode('ascii')
+    if algorithm not in DIGEST_SIZES:
+        raise ValueError("Unsupported hash algorithm: %s" % algorithm)
+    return (algorithm, count)
+
+################################################################################
+class HashSetReader:
+    def __init__(self, path):
+        """ Search a binary hash set written by SortedHashSetWriter. The file
+            is memory mapped, so there is no load cost and only the pages
+            touched by each binary search are read. """
+        self.path = path
+        self.file = open(path, 'rb')
+        (self.algorithm, self.count) = read_header(self.file)
+        self.width = DIGEST_SIZES[self.algorithm]
+        self.map = None
+        if self.count:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self.map) < HEADER.size + self.count * self.width:
+                self.close()
+                raise ValueError("Not a binary hash set: file is truncated")
+
+    def __contains__(self, digest):
+        """ Return True if a raw digest is in the hash set. """
+        if self.map is None or len(digest) != self.width:
+            return False
+        m = self.map
+        width = self.width
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * width
+            record = m[offset:offset + width]
+            if record < digest:
+                lo = mid + 1
+            elif record > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __iter__(self):
+        """ Iterate over the raw digests in the hash set, in order. """
+        self.file.seek(HEADER.size)
+        count = 0
+        for digest in _iter_records(self.file, self.width):
+            if count == self.count:
+                break
+            count += 1
+            yield digest
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _bloom_positions(digest, bits, hashes):
+    """ Helper method to return the bit positions of a digest. Digests are
+        uniformly distributed, so two halves of the digest are used with
+        double hashing instead of computing new hash functions. """
+    half = len(digest) // 2
+    h1 = int.from_bytes(digest[:half], "little")
+    h2 = int.from_bytes(digest[half:], "little") | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+def write_bloom_filter(path, reader, bits_per_digest=BLOOM_BITS_PER_DIGEST):
+    """ Write a Bloom filter for all of the digests in a hash set (a
+        HashSetReader). Returns the size of the filter in bits. """
+    bits = max(64, reader.count * bits_per_digest)
+    bits = (bits + 7) // 8 * 8
+    hashes = max(1, round(bits_per_digest * math.log(2)))
+    array = bytearray(bits // 8)
+    for digest in reader:
+        for position in _bloom_positions(digest, bits, hashes):
+            array[position >> 3] |= 1 << (position & 7)
+    with open(path, 'wb') as f:
+        f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, bits, hashes, reader.count))
+        f.write(array)
+    return bits
+
+class BloomFilterReader:
+    def __init__(self, path, count=None):
+        """ Test digests against a memory mapped Bloom filter. If count is
+            given, it must match the hash set count the filter was built for. """
+        self.file = open(path, 'rb')
+        data = self.file.read(BLOOM_HEADER.size)
+        if len(data) != BLOOM_HEADER.size:
+            self.file.close()
+            raise ValueError("Not a Bloom filter: file is too short")
+        (magic, self.bits, self.hashes, self.count) = BLOOM_HEADER.unpack(data)
+        if magic != BLOOM_MAGIC:
+            self.file.close()
+            raise ValueError("Not a Bloom filter: bad magic")
+        if count is not None and count != self.count:
+            self.file.close()
+            raise ValueError("Bloom filter does not match the hash set (rebuild it)")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < BLOOM_HEADER.size + self.bits // 8:
+            self.close()
+            raise ValueError("Not a Bloom filter: file is truncated")
+
+    def __contains__(self, digest):
+        """ Return False if a raw digest is definitely not in the hash set. """
+        m = self.map
+        for position in _bloom_positions(digest, self.bits, self.hashes):
+            if not m[BLOOM_HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class BloomFilter:
+    def __init__(self, capacity, bits_per_digest=BLOOM_BITS_PER_DIGEST):
+        """ In memory Bloom filter for up to capacity digests. Memory use is
+            fixed (bits_per_digest bits per digest), but a digest that was
+            never added is (rarely) reported as present. """
+        self.bits = max(64, capacity * bits_per_digest)
+        self.bits = (self.bits + 7) // 8 * 8
+        self.hashes = max(1, round(bits_per_digest * math.log(2)))
+        self.array = bytearray(self.bits // 8)
+        self.count = 0
+
+    def add(self, digest):
+        """ Add a digest. Returns True if it was (probably) already present. """
+        present = True
+        for position in _bloom_positions(digest, self.bits, self.hashes):
+            mask = 1 << (position & 7)
+            if not self.array[position >> 3] & mask:
+                self.array[position >> 3] |= mask
+                present = False
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, digest):
+        for position in _bloom_positions(digest, self.bits, self.hashes):
+            if not self.array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+imagereader.py is a helper module that reads byte ranges from a disk image.
+Raw (dd) images, including split images (image.001, image.002, ...), are
+opened once and memory mapped. Other container formats (e.g. E01) are read
+using the img_cat tool from The Sleuth Kit. Reads go through an LRU block
+cache, so neighbouring reads (e.g. small files in adjacent clusters) are
+served from memory. Backends for other formats are added using
+register_backend.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+
+"""
+
+__version__ = "0.1.0"
+
+import os
+import re
+import mmap
+import bisect
+import threading
+import subprocess
+import collections
+
+# Size of each block held in the cache, and the default cache size
+BLOCK_SIZE = 64 * 1024
+CACHE_SIZE = 64 * 1024 * 1024
+
+# Size of each chunk yielded by read_runs
+CHUNK_SIZE = 1024 * 1024
+
+# Magic bytes of image container formats, which are not raw images
+CONTAINER_MAGIC = [b"EVF\x09\x0d\x0a\xff\x00",     # EnCase (E01)
+                   b"LVF\x09\x0d\x0a\xff\x00",     # EnCase logical (L01)
+                   b"AFF10\r\n",                   # AFF
+                   b"KDMV",                        # VMDK
+                   b"conectix",                    # VHD
+                   b"vhdxfile",                    # VHDX
+                   b"QFI\xfb"]                     # QCOW
+
+# Split raw image segment names (e.g. image.001)
+SEGMENT_NAME = re.compile(r"^(.*)\.(\d{3})$")
+
+# File name extensions of raw images
+RAW_EXTENSIONS = (".raw", ".dd", ".img", ".bin")
+
+# (offset, magic bytes) of partition tables and file systems at the start of
+# a raw image, used when the file name does not identify a raw image
+RAW_SIGNATURES = [(510, b"\x55\xaa"),                 # MBR or boot sector
+                  (512, b"EFI PART"),                   # GPT
+                  (3, b"NTFS    "),                     # NTFS
+                  (3, b"EXFAT   "),                     # exFAT
+                  (1080, b"\x53\xef"),                 # ext2/3/4
+                  (1024, b"H+"),                        # HFS+
+                  (1024, b"HX"),                        # HFSX
+                  (32, b"NXSB")]                        # APFS
+
+################################################################################
+class RawImage:
+    def __init__(self, path):
+        """ Raw (dd) image backend. A split image is opened using any of its
+            segments, and every segment is memory mapped. """
+        self.path = path
+        self.segments = list()
+        self.starts = list()
+        self.size = 0
+        for segment in raw_segments(path):
+            with open(segment, 'rb') as f:
+                length = os.fstat(f.fileno()).st_size
+                if length == 0:
+                    continue
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.starts.append(self.size)
+            self.segments.append(m)
+            self.size += length
+
+    @classmethod
+    def probe(cls, path):
+        """ Return True if the image is a raw image: it is not a known
+            container format, and either its name is that of a raw image, or
+            it starts with a partition table or file system. Anything else is
+            left to the next backend. """
+        with open(path, 'rb') as f:
+            head = f.read(2048)
+        if any(head.startswith(magic) for magic in CONTAINER_MAGIC):
+            return False
+        if path.lower().endswith(RAW_EXTENSIONS) or SEGMENT_NAME.match(path):
+            return True
+        return any(head[offset:offset + len(magic)] == magic
+                   for (offset, magic) in RAW_SIGNATURES)
+
+    def read(self, offset, length):
+        """ Read up to length bytes at offset (less at the end of the image). """
+        parts = list()
+        while length > 0 and offset < self.size:
+            index = bisect.bisect_right(self.starts, offset) - 1
+            m = self.segments[index]
+            start = offset - self.starts[index]
+            data = m[start:start + length]
+            parts.append(data)
+            offset += len(data)
+            length -= len(data)
+        if len(parts) == 1:
+            return parts[0]
+        return b"".join(parts)
+
+    def close(self):
+        for m in self.segments:
+            m.close()
+        self.segments = list()
+
+def raw_segments(path):
+    """ Return the segment files of a raw image. For a split image (name
+        ending in .000 or .001), these are all of the numbered segments. """
+    match = SEGMENT_NAME.match(path)
+    if match is None:
+        return [path]
+    (base, number) = (match.group(1), int(match.group(2)))
+    # Start from the first segment, even if a later one was given
+    number = 0 if os.path.exists("%s.000" % base) else 1
+    segments = list()
+    while os.path.exists("%s.%03d" % (base, number)):
+        segments.append("%s.%03d" % (base, number))
+        number += 1
+    return segments or [path]
+
+class ImgCatImage:
+    # Sector size used for img_cat reads
+    SECTOR_SIZE = 512
+
+    # Each read starts img_cat (which opens the container again), so whole
+    # runs are streamed from one img_cat instead of using the block cache
+    STREAMED = True
+
+    def __init__(self, path):
+        """ Backend for any image format supported by The Sleuth Kit (e.g.
+            E01), which runs img_cat for each read. """
+        self.path = path
+
+    @classmethod
+    def probe(cls, path):
+        return True
+
+    def read(self, offset, length):
+        return b"".join(self.stream(offset, length, max(1, length)))
+
+    def stream(self, offset, length, chunk_size=CHUNK_SIZE):
+        """ Generator. Yields length bytes at offset in chunks of at most
+            chunk_size, read by a single img_cat. """
+        if length <= 0:
+            return
+        first = offset // self.SECTOR_SIZE
+        last = (offset + length - 1) // self.SECTOR_SIZE
+        command = ["img_cat", "-s", str(first), "-e", str(last), self.path]
+        try:
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+        except OSError as e:
+            raise IOError("img_cat failed for %s: %s" % (self.path, e))
+        try:
+            skip = offset - first * self.SECTOR_SIZE
+            while skip > 0:
+                data = proc.stdout.read(skip)
+                if not data:
+                    break
+                skip -= len(data)
+            while length > 0:
+                data = proc.stdout.read(min(chunk_size, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            returncode = proc.wait()
+        if length > 0 and returncode != 0:
+            raise IOError("img_cat failed for %s: exit status %d" % (self.path, returncode))
+
+    def close(self):
+        pass
+
+# Image backends, in the order they are probed
+BACKENDS = [RawImage, ImgCatImage]
+
+def register_backend(backend, first=True):
+    """ Add an image backend, a class with a probe(path) class method, a
+        read(offset, length) method and a close method. A backend with a
+        true STREAMED attribute is not read through the block cache, and
+        must also have a stream(offset, length, chunk_size) generator. """
+    if first:
+        BACKENDS.insert(0, backend)
+    else:
+        BACKENDS.insert(len(BACKENDS) - 1, backend)
+
+################################################################################
+class CachedImage:
+    def __init__(self, backend, block_size=BLOCK_SIZE, cache_size=CACHE_SIZE):
+        """ Read an image backend through an LRU cache of block_size blocks,
+            holding at most cache_size bytes. Thread safe. """
+        self.backend = backend
+        self.block_size = block_size
+        self.max_blocks = max(1, cache_size // block_size)
+        self.blocks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _block(self, index):
+        """ Helper method to return a block, reading it on a cache miss. """
+        with self.lock:
+            data = self.blocks.get(index)
+            if data is not None:
+                self.blocks.move_to_end(index)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = self.backend.read(index * self.block_size, self.block_size)
+        with self.lock:
+            self.blocks[index] = data
+            self.blocks.move_to_end(index)
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return data
+
+    def read(self, offset, length):
+        """ Read up to length bytes at offset (less at the end of the image). """
+        parts = list()
+        while length > 0:
+            (index, start) = divmod(offset, self.block_size)
+            block = self._block(index)
+            data = block[start:start + length]
+            if not data:
+                break
+            parts.append(data)
+            offset += len(data)
+            length -= len(data)
+        if len(parts) == 1:
+            return parts[0]
+        return b"".join(parts)
+
+    def read_runs(self, runs, chunk_size=CHUNK_SIZE):
+        """ Generator. Yields the contents of (img_offset, length, fill) runs
+            in chunks of at most chunk_size. """
+        streamed = getattr(self.backend, "STREAMED", False)
+        for (img_offset, length, fill) in runs:
+            if fill is not None:
+                while length > 0:
+                    size = min(chunk_size, length)
+                    yield bytes([int(fill)]) * size
+                    length -= size
+                continue
+            if streamed:
+                for chunk in self.backend.stream(img_offset, length, chunk_size):
+                    yield chunk
+                    img_offset += len(chunk)
+                    length -= len(chunk)
+                if length > 0:
+                    raise IOError("Read past the end of the image at offset %d" % img_offset)
+                continue
+            while length > 0:
+                chunk = self.read(img_offset, min(chunk_size, length))
+                if not chunk:
+                    raise IOError("Read past the end of the image at offset %d" % img_offset)
+                yield chunk
+                img_offset += len(chunk)
+                length -= len(chunk)
+
+    def close(self):
+        self.blocks.clear()
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def open_image(path, cache_size=CACHE_SIZE, block_size=BLOCK_SIZE):
+    """ Open a disk image using the first backend that accepts it, with an
+        LRU block cache of cache_size bytes. """
+    for backend in BACKENDS:
+        if backend.probe(path):
+            return CachedImage(backend(path), block_size, cache_size)
+    raise IOError("Unsupported image format: %s" % path)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+instrument.py is a helper module that records throughput statistics for
+each tool: files processed, bytes parsed and hashed, the time spent in each
+phase (e.g. parse, match, extract, hash, serialize) and peak memory use.
+Statistics are reported on an interval to standard error (stderr) and/or
+appended to a JSON lines stats file. A run can also be profiled using
+cProfile or tracemalloc.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+
+"""
+
+__version__ = "0.1.0"
+
+import sys
+import io
+import json
+import time
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # Peak memory use is not available (e.g. on Windows)
+    resource = None
+
+# Profilers supported by --profile
+PROFILERS = ("cprofile", "tracemalloc")
+
+# Number of entries printed in a profile summary
+PROFILE_LIMIT = 30
+
+################################################################################
+def add_arguments(parser):
+    """ Add the statistics and profiling options to an argument parser. """
+    group = parser.add_argument_group("instrumentation")
+    group.add_argument("--stats-interval",
+                       metavar = "SECONDS",
+                       help = "Report throughput statistics every SECONDS (to stderr, unless --stats is given)",
+                       type = float)
+    group.add_argument("--stats",
+                       metavar = "FILE",
+                       help = "Append throughput statistics to FILE as JSON lines")
+    group.add_argument("--profile",
+                       help = "Profile the run using cProfile (time) or tracemalloc (memory)",
+                       choices = PROFILERS)
+    group.add_argument("--profile-output",
+                       metavar = "FILE",
+                       help = "Write the profile to FILE (default: summary on stderr)")
+
+def peak_rss_kb(who=None):
+    """ Return the peak resident set size in KB of this process (or its
+        children, if who is RUSAGE_CHILDREN), or None if not available. """
+    if resource is None:
+        return None
+    if who is None:
+        who = resource.RUSAGE_SELF
+    max_rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        # Reported in bytes on macOS, KB elsewhere
+        max_rss //= 1024
+    return max_rss
+
+def _format_bytes(count):
+    """ Helper method to format a byte count (e.g. 12.3 MB). """
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            break
+        count /= 1024.0
+    return "%.1f %s" % (count, unit)
+
+class Stats:
+    def __init__(self, name, interval=None, output=None, profiler=None, enabled=None):
+        """ Throughput statistics for a tool. Counters are increased with
+            count, and time is added to a phase with phase or iterate. If
+            interval is given, statistics are reported every interval
+            seconds, to the stats file output (JSON lines) or stderr.
+            Statistics are only recorded if enabled, which by default is when
+            interval or output is given; otherwise each method is a no-op, so
+            the hot loops of a tool run at full speed. """
+        self.name = name
+        self.interval = interval
+        self.output = output
+        self.profiler = profiler
+        if enabled is None:
+            enabled = interval is not None or output is not None
+        self.enabled = enabled
+        self.counters = {"files" : 0, "bytes_parsed" : 0, "bytes_hashed" : 0}
+        self.phases = dict()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.next_report = None
+        if interval:
+            self.next_report = time.monotonic() + interval
+        if self.profiler is not None:
+            self.profiler.start()
+
+    @classmethod
+    def from_args(cls, name, args):
+        """ Create Stats (and start profiling) from add_arguments options. """
+        profiler = None
+        if args.profile:
+            profiler = Profiler(args.profile, args.profile_output)
+        return cls(name, args.stats_interval, args.stats, profiler)
+
+    def count(self, files=0, **counters):
+        """ Increase the files counter, and any other named counters (e.g.
+            bytes_parsed, bytes_hashed, matches). Thread safe. """
+        if not self.enabled:
+            return
+        due = False
+        with self.lock:
+            self.counters["files"] += files
+            for (name, value) in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            # Only one thread reports each interval
+            if self.next_report is not None and time.monotonic() >= self.next_report:
+                self.next_report = time.monotonic() + self.interval
+                due = True
+        if due:
+            self.report()
+
+    def add_time(self, phase, seconds):
+        """ Add time to a phase. Thread safe, so with a thread pool a phase
+            can add up to more than the elapsed time. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def phase(self, phase):
+        """ Context manager that adds the time spent in the block to a phase. """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed(phase)
+
+    @contextlib.contextmanager
+    def _timed(self, phase):
+        """ Helper method to time a block for phase. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def iterate(self, iterable, phase="parse"):
+        """ Return an iterator over iterable that adds the time taken to
+            produce each item (e.g. parsing a fileobject) to a phase. If
+            statistics are not enabled, iterable is returned unchanged. """
+        if not self.enabled:
+            return iterable
+        return self._iterate(iterable, phase)
+
+    def _iterate(self, iterable, phase):
+        """ Generator. Helper method to time each item of iterable. """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(phase, time.perf_counter() - start)
+                return
+            self.add_time(phase, time.perf_counter() - start)
+            yield item
+
+    def snapshot(self, final=False):
+        """ Return the current statistics as a dictionary. """
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            counters = dict(self.counters)
+            phases = dict(self.phases)
+        rates = dict()
+        for (name, value) in counters.items():
+            rates[name + "_per_second"] = value / elapsed if elapsed > 0 else 0.0
+        return {"tool" : self.name,
+                "time" : time.time(),
+                "final" : final,
+                "elapsed" : elapsed,
+                "counters" : counters,
+                "rates" : rates,
+                "phases" : phases,
+                "peak_rss_kb" : peak_rss_kb(),
+                "peak_rss_children_kb" : peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None}
+
+    def report(self, final=False):
+        """ Report the current statistics, to the stats file or stderr. """
+        stats = self.snapshot(final)
+        if self.output is not None:
+            with open(self.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(stats, sort_keys=True) + "\n")
+            return
+        counters = stats["counters"]
+        rates = stats["rates"]
+        parts = ["%.1fs" % stats["elapsed"],
+                 "files=%d (%.0f/s)" % (counters["files"], rates["files_per_second"])]
+        for name in ("bytes_parsed", "bytes_hashed"):
+            if counters.get(name):
+                parts.append("%s=%s (%s/s)" % (name.split("_")[1],
+                                                _format_bytes(counters[name]),
+                                                _format_bytes(rates[name + "_per_second"])))
+        for (name, value) in sorted(counters.items()):
+            if name not in ("files", "bytes_parsed", "bytes_hashed"):
+                parts.append("%s=%d" % (name, value))
+        for (name, seconds) in sorted(stats["phases"].items()):
+            parts.append("%s=%.2fs" % (name, seconds))
+        if stats["peak_rss_kb"] is not None:
+            parts.append("peak_rss=%s" % _format_bytes(stats["peak_rss_kb"] * 1024))
+        sys.stderr.write("[%s%s] %s\n" % (self.name, " final" if final else "", " ".join(parts)))
+        sys.stderr.flush()
+
+    def close(self):
+        """ Write the final statistics (if enabled) and stop profiling. """
+        if self.enabled:
+            self.report(final=True)
+        self.enabled = False
+        self.next_report = None
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+
+class CountingReader(io.RawIOBase):
+    def __init__(self, f, stats):
+        """ Binary file wrapper that adds the bytes read to the bytes_parsed
+            counter of stats. """
+        self.f = f
+        self.stats = stats
+        self.name = getattr(f, "name", None)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.stats.count(bytes_parsed=len(data))
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        io.RawIOBase.close(self)
+
+class Profiler:
+    def __init__(self, mode, output=None):
+        """ Profile a run using cProfile (mode cprofile) or tracemalloc (mode
+            tracemalloc). The profile is written to output, or a summary is
+            printed to stderr. """
+        if mode not in PROFILERS:
+            raise ValueError("Unsupported profiler: %s" % mode)
+        self.mode = mode
+        self.output = output
+        self.profile = None
+
+    def start(self):
+        if self.mode == "cprofile":
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            import tracemalloc
+            tracemalloc.start(25)
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._stop_cprofile()
+        else:
+            self._stop_tracemalloc()
+
+    def _stop_cprofile(self):
+        import pstats
+        self.profile.disable()
+        if self.output is not None:
+            # Binary pstats file, for snakeviz or python3 -m pstats
+            self.profile.dump_stats(self.output)
+            return
+        stats = pstats.Stats(self.profile, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(PROFILE_LIMIT)
+
+    def _stop_tracemalloc(self):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = ["Traced memory: current %s, peak %s" % (_format_bytes(current), _format_bytes(peak))]
+        for stat in snapshot.statistics("lineno")[:PROFILE_LIMIT]:
+            lines.append(str(stat))
+        if self.output is not None:
+            with open(self.output, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            return
+        sys.stderr.write("\n".join(lines) + "\n")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Date:    2026/10/16
+
+Description:
+sharded.py is a helper module that parses a large DFXML report using a
+pool of processes. The report is split into shards at <fileobject>
+boundaries, each shard is wrapped in the document element of the report
+and parsed by a worker process, and the results of each shard are returned
+in document order, or as soon as each shard finishes.
+
+Copyright (c) 2026, DFXMLTools contributors
+
+###############################################################################
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###############################################################################
+
+>>> CHANGELOG:
+    0.1.0       Base functionality
+    0.2.0       Share fileobject parsing with fileobjects.py
+    0.3.0       Filter fileobject Elements before building FileObjects
+
+"""
+
+__version__ = "0.3.0"
+
+import io
+import re
+import mmap
+import queue
+import collections
+import multiprocessing
+
+import fastparse
+import compressed
+
+FILEOBJECT_START = b"<fileobject"
+FILEOBJECT_END = b"</fileobject>"
+
+# Target size of each shard, there are also at least four shards per job
+SHARD_SIZE = 32 * 1024 * 1024
+SHARDS_PER_JOB = 4
+
+# Number of shards queued per process, so results are not parsed far ahead
+# of a slow consumer
+IN_FLIGHT_PER_JOB = 2
+
+# Matches the start tag of the document element (skipping the prolog)
+ROOT_TAG = re.compile(rb"<([A-Za-z_][\w.:-]*)[^>]*>")
+
+################################################################################
+def is_shardable(xmlfile):
+    """ Return True if the DFXML report can be split into shards, which
+        needs random access (so compressed reports cannot be sharded). """
+    return compressed.detect_compression(xmlfile) is None
+
+def find_shards(xmlfile, jobs):
+    """ Split a DFXML report into shards that start at a <fileobject>
+        boundary. Returns a list of (xmlfile, start, end, root_tag) tuples,
+        where root_tag is the start tag of the document element. """
+    with open(xmlfile, 'rb') as f:
+        size = f.seek(0, io.SEEK_END)
+        if size == 0:
+            return list()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            first = _next_fileobject(m, 0)
+            if first < 0:
+                return list()
+            root_tag = ROOT_TAG.search(m, 0, first).group(0)
+            last = m.rfind(FILEOBJECT_END) + len(FILEOBJECT_END)
+            count = max(jobs * SHARDS_PER_JOB, (last - first) // SHARD_SIZE)
+            step = max(1, (last - first) // count)
+            # Move each split point forward to the next fileobject
+            boundaries = [first]
+            for split in range(first + step, last, step):
+                boundary = _next_fileobject(m, max(split, boundaries[-1] + 1))
+                if boundary < 0 or boundary >= last:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+            boundaries.append(last)
+    return [(xmlfile, start, end, root_tag)
+            for (start, end) in zip(boundaries, boundaries[1:])]
+
+def _next_fileobject(m, pos):
+    """ Helper method to find the next <fileobject> start tag. """
+    while True:
+        i = m.find(FILEOBJECT_START, pos)
+        if i < 0:
+            return -1
+        c = m[i + len(FILEOBJECT_START):i + len(FILEOBJECT_START) + 1]
+        if c in (b">", b" ", b"\t", b"\r", b"\n", b"/"):
+            return i
+        pos = i + len(FILEOBJECT_START)
+
+def read_shard(xmlfile, start, end, root_tag):
+    """ Read a shard as a well formed document. Only the fileobjects in the
+        shard are kept (volume tags between them are dropped), and they are
+        wrapped in the document element of the report. """
+    with open(xmlfile, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    parts = [root_tag]
+    pos = 0
+    while True:
+        i = _next_fileobject(data, pos)
+        if i < 0:
+            break
+        j = data.find(FILEOBJECT_END, i)
+        if j < 0:
+            break
+        pos = j + len(FILEOBJECT_END)
+        parts.append(data[i:pos])
+    name = ROOT_TAG.match(root_tag).group(1)
+    parts.append(b"</" + name + b">")
+    return b"".join(parts)
+
+################################################################################
+class FieldsWorker:
+    def __init__(self, fields, predicate=None):
+        """ Shard worker that extracts fields of each fileobject (see
+            fastparse). If predicate is given, only records where
+            predicate(record) is true are returned. """
+        self.fields = fields
+        self.predicate = predicate
+
+    def __call__(self, shard):
+        records = list()
+        extractor = fastparse.FieldExtractor(self.fields, records.append)
+        extractor.feed(read_shard(*shard), final=True)
+        count = len(records)
+        if self.predicate is not None:
+            records = [record for record in records if self.predicate(record)]
+        return (count, records)
+
+class FileObjectWorker:
+    def __init__(self, predicate=None, prefilter=None):
+        """ Shard worker that builds an Objects.FileObject for each
+            fileobject, and returns those where predicate(fi) is true. If
+            prefilter is given, it is called with the fileobject Element
+            first, and no FileObject is built if it returns false. """
+        self.predicate = predicate
+        self.prefilter = prefilter
+
+    def __call__(self, shard):
+        # Imported here, as fileobjects needs the DFXML Objects module
+        import Objects
+        import fileobjects
+        matches = list()
+        count = 0
+        for elem in fileobjects.iter_fileobject_elements(io.BytesIO(read_shard(*shard))):
+            count += 1
+            if self.prefilter is not None and not self.prefilter(elem):
+                continue
+            fi = Objects.FileObject()
+            fi.populate_from_Element(elem)
+            if self.predicate is None or self.predicate(fi):
+                matches.append(fi)
+        return (count, matches)
+
+def map_shards(xmlfile, worker, jobs, ordered=True):
+    """ Generator. Parse the shards of a DFXML report in a pool of jobs
+        processes, yielding the (count, results) tuple returned by the
+        worker for each shard. If ordered is False, shard results are
+        yielded as soon as they are available. At most IN_FLIGHT_PER_JOB
+        shards per process are queued, so the parsed results held in
+        memory are bounded. The worker, and any predicate or filter it
+        uses, is sent to the pool processes so it must be picklable. """
+    shards = find_shards(xmlfile, jobs)
+    if not shards:
+        return
+    with multiprocessing.Pool(processes=jobs) as pool:
+        if ordered:
+            results = _map_ordered(pool, worker, shards, jobs * IN_FLIGHT_PER_JOB)
+        else:
+            results = _map_unordered(pool, worker, shards, jobs * IN_FLIGHT_PER_JOB)
+        for result in results:
+            yield result
+
+def _map_ordered(pool, worker, shards, in_flight):
+    """ Generator. Helper method to yield shard results in document order. """
+    pending = collections.deque()
+    for shard in shards:
+        pending.append(pool.apply_async(worker, (shard,)))
+        if len(pending) >= in_flight:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _map_unordered(pool, worker, shards, in_flight):
+    """ Generator. Helper method to yield shard results as each finishes. """
+    done = queue.Queue()
+    submitted = 0
+    received = 0
+    shards = iter(shards)
+    while True:
+        while submitted - received < in_flight:
+            shard = next(shards, None)
+            if shard is None:
+                break
+            pool.apply_async(worker, (shard,),
+                             callback = lambda result: done.put((True, result)),
+                             error_callback = lambda e: done.put((False, e)))
+            submitted += 1
+        if received == submitted:
+            return
+        (ok, result) = done.get()
+        received += 1
+        if not ok:
+            raise result
+        yield result